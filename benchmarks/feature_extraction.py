@@ -0,0 +1,97 @@
+"""Compare per-position feature extraction time of chevy, the native extractor
+(one color at a time and both colors from a shared analysis) and the batched
+NumPy extractor.
+
+Run from the repository root:
+
+    python -m benchmarks.feature_extraction [pgn_path] [n_games]
+"""
+
+import sys
+import time
+
+import chess
+import numpy as np
+from chevy.features import KingSafety, PawnStructure, BoardFeatures
+
+from src.features.chevy import (
+    CHEVY_BOARD_FEATURES,
+    CHEVY_KING_FEATURES,
+    CHEVY_PAWN_FEATURES,
+)
+from src.features.batch import feature_matrices
+from src.features.extractor import FEATURES, extract_both_colors, extract_features
+from src.pgn.index import PgnIndex
+from src.pgn.positions import mainline_positions
+
+
+def chevy_features(board, color):
+    """Extract features the way `ChessGame` did, with three chevy objects."""
+
+    features = {}
+    for extractor, names in (
+        (KingSafety(board, color=color), CHEVY_KING_FEATURES),
+        (PawnStructure(board, color=color), CHEVY_PAWN_FEATURES),
+        (BoardFeatures(board, color=color), CHEVY_BOARD_FEATURES),
+    ):
+        for name in names:
+            value = getattr(extractor, name)
+            features[name] = sum(value) if isinstance(value, list) else int(value)
+    return features
+
+
+def load_positions(pgn_path, n_games):
+    """Collect every mainline position of the first `n_games` games."""
+
+    index = PgnIndex(pgn_path)
+    positions = []
+    for n in range(1, min(n_games, len(index)) + 1):
+        positions.extend(mainline_positions(index.read_game(n))[1:])
+    return positions
+
+
+def benchmark(extract, positions):
+    """Return the results and the mean extraction time per position in microseconds."""
+
+    start = time.perf_counter()
+    results = [extract(board, color) for board in positions for color in chess.COLORS]
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(results) * 1e6
+
+
+def main():
+    pgn_path = sys.argv[1] if len(sys.argv) > 1 else "data/1.pgn"
+    n_games = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    positions = load_positions(pgn_path, n_games)
+    print(f"Benchmarking {len(positions)} positions from {pgn_path}, both colors.")
+
+    chevy_results, chevy_time = benchmark(chevy_features, positions)
+    native_results, native_time = benchmark(extract_features, positions)
+
+    start = time.perf_counter()
+    both_results = [extract_both_colors(board) for board in positions]
+    both_time = (time.perf_counter() - start) / (2 * len(positions)) * 1e6
+    shared_results = [features[color] for features in both_results for color in chess.COLORS]
+
+    start = time.perf_counter()
+    matrices = feature_matrices(positions)
+    batch_time = (time.perf_counter() - start) / (2 * len(positions)) * 1e6
+
+    native_rows = np.array([[features[name] for name in FEATURES] for features in native_results])
+    batch_rows = np.stack([matrices[color] for color in chess.COLORS], axis=1).reshape(-1, len(FEATURES))
+
+    mismatches = sum(a != b for a, b in zip(chevy_results, native_results))
+    shared_mismatches = sum(a != b for a, b in zip(native_results, shared_results))
+    batch_mismatches = int((native_rows != batch_rows).any(axis=1).sum())
+    print(f"chevy:  {chevy_time:8.1f} us/position")
+    print(f"native: {native_time:8.1f} us/position")
+    print(f"shared: {both_time:8.1f} us/position")
+    print(f"batch:  {batch_time:8.1f} us/position")
+    print(f"speedup: {chevy_time / native_time:.1f}x, mismatches: {mismatches}")
+    print(f"shared speedup: {chevy_time / both_time:.1f}x, mismatches: {shared_mismatches}")
+    print(f"batch speedup: {chevy_time / batch_time:.1f}x, mismatches: {batch_mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import asyncio
+
+from src.engine.limits import ANALYSIS_LIMIT
+from src.engine.pool import AsyncEnginePool
+from src.pgn.index import PgnIndex
+from src.pgn.positions import mainline_positions
+from src.pgn.visitor import MainlineVisitor
+
+
+class AsyncChessGame:
+    """Asyncio counterpart of `ChessGame` for analysing games inside an event loop.
+
+    Create instances with `await AsyncChessGame.load(...)`. File reads run in a
+    worker thread and analyses go through an `AsyncEnginePool`, so many games
+    can be loaded and analysed concurrently without blocking the loop.
+    """
+
+    def __init__(self, game, engine, owns_engine=False):
+        self.game = game
+        self.engine = engine
+        self._owns_engine = owns_engine
+
+        self.moves = list(self.game.mainline_moves())
+        self.positions = mainline_positions(self.game)
+
+    @classmethod
+    async def load(
+        cls,
+        pgn_path,
+        game_number=1,
+        engine_path=r"stockfish.exe",
+        mainline_only=False,
+        engine=None,
+    ):
+        """Load the n-th game from a PGN file, starting an engine unless a pool is given."""
+
+        game = await asyncio.to_thread(_read_game, pgn_path, game_number, mainline_only)
+
+        owns_engine = engine is None
+        if owns_engine:
+            engine = await AsyncEnginePool(engine_path, size=1).start()
+
+        return cls(game, engine, owns_engine)
+
+    async def analyse_game(self, limit=ANALYSIS_LIMIT):
+        """Analyse the position after every mainline move."""
+
+        return await self.engine.analyse_many(self.positions[1:], limit)
+
+    async def quit(self):
+        """Shut down the engine, unless it was passed in."""
+
+        if self._owns_engine:
+            await self.engine.quit()
+
+
+def _read_game(pgn_path, game_number, mainline_only):
+    """Read a single game through the PGN index."""
+
+    if mainline_only:
+        return PgnIndex(pgn_path).read_game(game_number, Visitor=MainlineVisitor)
+    return PgnIndex(pgn_path).read_game(game_number)
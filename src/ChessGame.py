@@ -2,16 +2,24 @@ import chess
 import chess.engine
 import chess.pgn
 import chess.svg
-from chevy.features import KingSafety, PawnStructure, BoardFeatures
 from IPython.display import display, SVG
 
+from src.annotation.annotator import MoveAnnotator
+from src.engine.budget import analyse_with_budget
+from src.engine.limits import ANALYSIS_LIMIT
+from src.engine.triage import analyse_critical
 from src.features.chevy import (
     CHEVY_BOARD_FEATURES,
     CHEVY_KING_FEATURES,
     CHEVY_PAWN_FEATURES,
 )
-
-MAX_POSITIONAL_FEAUTRES = 5
+from src.features.incremental import IncrementalFeatures
+from src.features.pawns import PawnHashTable
+from src.features.registry import resolve
+from src.GameCursor import GameCursor
+from src.pgn.index import PgnIndex
+from src.pgn.positions import mainline_positions
+from src.pgn.visitor import MainlineVisitor
 
 
 class ChessGame:
@@ -22,105 +30,197 @@ class ChessGame:
         pgn_path,
         game_number=1,
         engine_path=r"stockfish.exe",
+        mainline_only=False,
+        engine=None,
+        features=None,
     ):
         self.engine_path = engine_path
-        self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
-        self._load_game(pgn_path, game_number)
+        self._owns_engine = engine is None
+        self.engine = engine or chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        self._load_game(pgn_path, game_number, mainline_only)
 
         self.king_features = CHEVY_KING_FEATURES
         self.pawn_features = CHEVY_PAWN_FEATURES
         self.board_features = CHEVY_BOARD_FEATURES
+        # Printing only a few features skips computing the rest.
+        self.features = resolve(features or self.king_features + self.pawn_features + self.board_features)
+        self.pawn_table = PawnHashTable()
+        self.feature_tracker = IncrementalFeatures(self.features, self.pawn_table)
 
     def simulate_game(self, display_board=False, print_evaluation=False, n_moves=None):
         """Simulate the entire game and optionally display the board after each move."""
 
         self.board = self.game.board()
-        for i, _ in enumerate(self.game.mainline_moves()):
+        for i in range(len(self.moves)):
             if n_moves and i == n_moves:
                 break
 
             self.get_nth_move(i + 1, display_board, print_evaluation)
 
     def get_nth_move(self, n, display_board=False, print_evaluation=False):
-        """Retrieve the n-th move and optionally display the board."""
+        """Retrieve the n-th move and optionally display the board.
 
-        self.board = self.game.board()
-        last_move = None
-        color = chess.WHITE if n % 2 == 1 else chess.BLACK
+        The cursor moves along, so `next_move` and `previous_move` continue from here.
+        """
 
-        for i, move in enumerate(self.game.mainline_moves()):
-            self.board.push(move)
-            if i == n - 1:
-                last_move = move
+        if n < 1 or n > len(self.moves):
+            self.cursor.seek(len(self.moves))
+            self.board = self.positions[-1].copy()
+            return None
 
-                if display_board:
-                    self._display_board(last_move)
+        self.cursor.seek(n)
+        self.board = self.positions[n].copy()
+        last_move = self.moves[n - 1]
+        self._show_move(n, last_move, display_board, print_evaluation)
 
-                if print_evaluation:
-                    print(f"Move {n}: {move.uci()}")
-                    self._print_move_evaluation(color)
+        return last_move
 
-                break
+    def next_move(self, display_board=False, print_evaluation=False):
+        """Step the cursor one move forward and optionally display the board."""
+
+        self.cursor.next()
+        return self._show_cursor(display_board, print_evaluation)
+
+    def previous_move(self, display_board=False, print_evaluation=False):
+        """Step the cursor one move back and optionally display the board."""
+
+        self.cursor.prev()
+        return self._show_cursor(display_board, print_evaluation)
+
+    def seek_move(self, n, display_board=False, print_evaluation=False):
+        """Move the cursor to the n-th move and optionally display the board."""
+
+        self.cursor.seek(n)
+        return self._show_cursor(display_board, print_evaluation)
+
+    def analyse_game(self, limit=ANALYSIS_LIMIT, triage=False, budget=None):
+        """Analyse the position after every mainline move.
+
+        Positions are analysed in parallel when the engine is an `EnginePool`.
+        With `triage`, a shallow pass finds the critical moves first and only
+        those are searched with `limit`. A `budget` in seconds replaces `limit`
+        with a time per position scaled to its complexity, totalling the budget
+        (shallow pass included).
+        """
+
+        if budget is not None:
+            return analyse_with_budget(self.engine, self.positions, budget, triage)
+        if triage:
+            return analyse_critical(self.engine, self.positions, limit)[0]
+
+        boards = self.positions[1:]
+        if hasattr(self.engine, "analyse_many"):
+            return self.engine.analyse_many(boards, limit)
+
+        return [self.engine.analyse(board, limit) for board in boards]
+
+    def annotate_moves(self, annotator=None):
+        """Return the feature comments of every mainline move, computed in one pass over the game."""
+
+        annotator = annotator or MoveAnnotator(features=self.features)
+        return annotator.annotate_positions(self.positions)
+
+    def analyse_alternatives(self, multipv=3, limit=ANALYSIS_LIMIT, annotator=None):
+        """Compare every mainline move with the engine's best lines from the position before it.
+
+        Each position is searched once for its `multipv` best lines (cached
+        when the engine is a `CachedEngine`). Returns, per move, the lines and
+        the (alternative, comments) pairs of `MoveAnnotator.compare_to_lines`.
+        """
+
+        annotator = annotator or MoveAnnotator(features=self.features)
+        alternatives = []
+        for board, move in zip(self.positions, self.moves):
+            lines = self.engine.analyse(board, limit, multipv=multipv)
+            alternatives.append((lines, annotator.compare_to_lines(board, move, lines)))
+        return alternatives
+
+    def write_annotated(self, writer, limit=ANALYSIS_LIMIT, annotator=None, triage=False, budget=None):
+        """Analyse and annotate every mainline move and write the game to an `AnnotatedPgnWriter`.
+
+        A game loaded with `mainline_only` is read again in full for writing.
+        """
+
+        game = self.game
+        if not isinstance(game, chess.pgn.Game):
+            game = PgnIndex(self.pgn_path).read_game(self.game_number)
+
+        scores = [info.get("score") for info in self.analyse_game(limit, triage, budget)]
+        writer.write(game, scores, self.annotate_moves(annotator))
+
+    def _show_cursor(self, display_board, print_evaluation):
+        """Make a copy of the cursor's position current and display it.
+
+        Pushing moves on `self.board` must not move the cursor.
+        """
+
+        self.board = self.cursor.board.copy()
+        last_move = self.cursor.last_move
+        self._show_move(self.cursor.ply, last_move, display_board, print_evaluation)
 
         return last_move
 
-    def _load_game(self, pgn_path, n=1):
-        """Load the n-th game from a PGN file."""
+    def _show_move(self, n, move, display_board, print_evaluation):
+        """Display and evaluate the current board reached by the n-th move."""
 
-        with open(pgn_path) as pgn_file:
-            current_game = None
-            for _ in range(n):
-                current_game = chess.pgn.read_game(pgn_file)
-                if current_game is None:
-                    raise ValueError("No such game number exists in the PGN file.")
-            self.game = current_game
-            self.board = self.game.board()
+        if display_board:
+            self._display_board(move)
 
-            print(
-                f"Loading game {n}.\nRound: {current_game.headers['Round']}\nWhite: {current_game.headers['White']}\nBlack: {current_game.headers['Black']}"
-            )
+        if print_evaluation and move:
+            color = chess.WHITE if n % 2 == 1 else chess.BLACK
+            print(f"Move {n}: {move.uci()}")
+            self._print_move_evaluation(color)
+
+    def _load_game(self, pgn_path, n=1, mainline_only=False):
+        """Load the n-th game from a PGN file, optionally skipping variations and comments."""
+
+        if mainline_only:
+            current_game = PgnIndex(pgn_path).read_game(n, Visitor=MainlineVisitor)
+        else:
+            current_game = PgnIndex(pgn_path).read_game(n)
+        self.pgn_path = pgn_path
+        self.game_number = n
+        self.game = current_game
+        self.board = self.game.board()
+        self._materialize_mainline()
+
+        print(
+            f"Loading game {n}.\nRound: {current_game.headers['Round']}\nWhite: {current_game.headers['White']}\nBlack: {current_game.headers['Black']}"
+        )
+
+    def _materialize_mainline(self):
+        """Replay the mainline once, keeping the moves and a snapshot of every position.
+
+        `positions[n]` is the board after the n-th move (`positions[0]` is the
+        starting position), so any ply is reached without replaying the game.
+        Snapshots keep their move stack, so the engine sees the game history
+        and repetitions are detected.
+        """
+
+        self.moves = list(self.game.mainline_moves())
+        self.positions = mainline_positions(self.game)
+        self.cursor = GameCursor(self.game.board(), self.moves)
 
     def _print_move_evaluation(self, color):
         """Evaluate and print the engine's evaluation of the current board state."""
 
-        info = self.engine.analyse(self.board, chess.engine.Limit(time=0.1))
+        info = self.engine.analyse(self.board, ANALYSIS_LIMIT)
         score = info["score"].relative
         print(f"""Evaluation for {"WHITE" if color else "BLACK"}: {score}""")
 
         self._print_features(color)
 
     def _print_features(self, color):
-        """Print the all positional features for the current board state."""
-
-        king_features = KingSafety(self.board, color=color)
-        pawn_features = PawnStructure(self.board, color=color)
-        board_features = BoardFeatures(self.board, color=color)
-
-        feature_values = []
-        for feature in self.king_features:
-            value = getattr(king_features, feature)
-            feature_values.append((feature, value))
-
-        for feature in self.pawn_features:
-            value = getattr(pawn_features, feature)
-            feature_values.append((feature, value))
-
-        for feature in self.board_features:
-            value = getattr(board_features, feature)
-            feature_values.append((feature, value))
-
-        numerical_features = []
-        for feature in feature_values:
-            if isinstance(feature[1], int):
-                numerical_features.append((feature[0], int(feature[1])))
-            elif isinstance(feature[1], list):
-                array_sum = 0
-                for i, value in enumerate(feature[1]):
-                    array_sum += value
-                numerical_features.append((f"{feature[0]}", array_sum))
+        """Print the selected positional features for the current board state.
+
+        Only features affected by the moves since the previous call for the
+        same color are recomputed.
+        """
+
+        features = self.feature_tracker.values(self.board, color)
 
         print("\nPositional features:")
-        for feature, value in numerical_features:
+        for feature, value in features.items():
             print(f"\t{feature}: {value}")
 
     def _display_board(self, last_move=None):
@@ -141,6 +241,7 @@ class ChessGame:
             display(SVG(chess.svg.board(board=self.board, size=350)))
 
     def __del__(self):
-        """Close the engine properly on deletion of the object."""
+        """Close the engine properly on deletion of the object, unless it was passed in."""
 
-        self.engine.quit()
+        if self._owns_engine:
+            self.engine.quit()
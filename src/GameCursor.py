@@ -0,0 +1,63 @@
+class GameCursor:
+    """Bidirectional cursor over the mainline of a game.
+
+    The cursor owns a single board that keeps its full move stack. Stepping
+    costs one push or pop, and seeking takes the shorter of walking from the
+    current ply or replaying from the starting position.
+    """
+
+    def __init__(self, start_board, moves):
+        self.moves = moves
+        self._start_board = start_board.copy()
+        self.board = start_board.copy()
+        self._base_ply = len(self.board.move_stack)
+
+    def __len__(self):
+        return len(self.moves)
+
+    @property
+    def ply(self):
+        """Number of mainline moves played on the cursor's board."""
+
+        return len(self.board.move_stack) - self._base_ply
+
+    @property
+    def last_move(self):
+        """Move that led to the current position, or None at the start."""
+
+        return self.moves[self.ply - 1] if self.ply else None
+
+    def next(self):
+        """Play the next mainline move and return it, or None at the end."""
+
+        if self.ply >= len(self.moves):
+            return None
+
+        move = self.moves[self.ply]
+        self.board.push(move)
+        return move
+
+    def prev(self):
+        """Take back the last move and return it, or None at the start."""
+
+        if not self.ply:
+            return None
+
+        return self.board.pop()
+
+    def seek(self, n):
+        """Move to the position after the n-th move (0 is the starting position)."""
+
+        if n < 0 or n > len(self.moves):
+            raise ValueError("No such move exists in the game.")
+
+        if n < self.ply - n:
+            self.board = self._start_board.copy()
+
+        while self.ply > n:
+            self.board.pop()
+
+        while self.ply < n:
+            self.board.push(self.moves[self.ply])
+
+        return self.last_move
@@ -0,0 +1,108 @@
+import heapq
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from src.features.batch import feature_matrices, feature_matrix
+from src.features.comments import BASE_COMMENTS, MAX_POSITIONAL_FEAUTRES
+from src.features.extractor import FEATURES
+from src.pgn.positions import mainline_positions
+from src.training.regression import WEIGHTS_PATH, load_weights
+
+# Features whose "positive" comment in `BASE_COMMENTS` describes a decrease,
+# that is, where the comments assume a higher value is worse. Also the sign of
+# the default weight of these features when no weight was fitted.
+LOWER_IS_BETTER = {"king_attackers_looking_at_ring_1", "checked", "isolated_pawns", "blocked_pawns"}
+
+FeatureComment = namedtuple("FeatureComment", ["feature", "delta", "score", "text"])
+
+
+class MoveAnnotator:
+    """Explains moves by the positional features they change the most.
+
+    For every move the features of the side that moved are compared before and
+    after it. Each change is scored by its size times the feature's learned
+    weight, so changes that raise the evaluation of the side that moved score
+    positive, and the `k` largest changes are turned into comments from
+    `BASE_COMMENTS` describing the direction of the change. Weights default to
+    the ones saved by `src.training.regression.save_weights`. Features without
+    a fitted weight (missing, or zero because they never varied) get a weight
+    of 1, negated for the features in `LOWER_IS_BETTER`.
+    """
+
+    def __init__(self, weights=None, k=MAX_POSITIONAL_FEAUTRES, features=FEATURES):
+        if weights is None:
+            weights = load_weights()[1] if os.path.exists(WEIGHTS_PATH) else {}
+
+        self.k = k
+        self.features = [feature for feature in features if feature in BASE_COMMENTS]
+        self._wording = np.array([-1 if feature in LOWER_IS_BETTER else 1 for feature in self.features])
+        self.weights = np.array(
+            [weights.get(feature) or (-1.0 if feature in LOWER_IS_BETTER else 1.0) for feature in self.features]
+        )
+
+    def annotate_game(self, game):
+        """Return the comments for every mainline move of a game."""
+
+        return self.annotate_positions(mainline_positions(game))
+
+    def annotate_positions(self, positions):
+        """Return a list of `FeatureComment`s for every move between consecutive positions.
+
+        Features are extracted once per position for both colors, so a game is
+        annotated in one pass over its positions.
+        """
+
+        if len(positions) < 2:
+            return []
+
+        deltas = {color: np.diff(matrix, axis=0) for color, matrix in feature_matrices(positions, self.features).items()}
+        scores = {color: delta * self.weights for color, delta in deltas.items()}
+
+        return [
+            self._top_comments(deltas[board.turn][ply], scores[board.turn][ply])
+            for ply, board in enumerate(positions[:-1])
+        ]
+
+    def compare_to_lines(self, board, move, lines):
+        """Compare `move` with the first move of every engine line from `board`.
+
+        `lines` are the infos of one MultiPV search, best line first. Returns
+        (alternative, comments) pairs in line order, skipping the line of the
+        played move, where the comments describe the features of the side to
+        move after `move` against those after the alternative.
+        """
+
+        alternatives = [line["pv"][0] for line in lines if line.get("pv") and line["pv"][0] != move]
+        if not alternatives:
+            return []
+
+        boards = []
+        for candidate in [move] + alternatives:
+            after = board.copy(stack=False)
+            after.push(candidate)
+            boards.append(after)
+
+        # One batched extraction covers the played move and every alternative.
+        matrix = feature_matrix(boards, board.turn, self.features)
+        comparisons = []
+        for alternative, features in zip(alternatives, matrix[1:]):
+            deltas = matrix[0] - features
+            suffix = f"compared to {board.san(alternative)}"
+            comparisons.append((alternative, self._top_comments(deltas, deltas * self.weights, suffix)))
+        return comparisons
+
+    def _top_comments(self, deltas, scores, suffix=None):
+        """Comments for the `k` changes with the largest absolute scores."""
+
+        changed = np.flatnonzero(scores)
+        top = heapq.nlargest(self.k, changed, key=lambda i: abs(scores[i]))
+        return [self._comment(i, deltas[i], scores[i], suffix) for i in top]
+
+    def _comment(self, index, delta, score, suffix=None):
+        feature = self.features[index]
+        text = BASE_COMMENTS[feature]["positive" if delta * self._wording[index] > 0 else "negative"]
+        if suffix:
+            text = f"{text[:-1]} {suffix}."
+        return FeatureComment(feature, int(delta), float(score), text)
@@ -0,0 +1,159 @@
+import logging
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+import chess
+import chess.engine
+import chess.pgn
+
+from src.annotation.annotator import MoveAnnotator
+from src.engine.budget import analyse_with_budget
+from src.engine.triage import analyse_critical
+from src.features.comments import MAX_POSITIONAL_FEAUTRES
+from src.pgn.index import PgnIndex
+from src.pgn.positions import mainline_positions
+from src.pgn.visitor import MainlineVisitor
+
+LOGGER = logging.getLogger(__name__)
+
+CORPUS_LIMIT = chess.engine.Limit(time=0.05)
+
+GameAnnotation = namedtuple("GameAnnotation", ["pgn_path", "game_number", "scores", "comments"])
+
+# Engine and annotator of the current worker process, set up once by `_start_worker`.
+_worker = {}
+
+
+class CorpusAnnotator:
+    """Annotates every game of several PGN files in a pool of worker processes.
+
+    Each PGN is cut into shards of consecutive game numbers. Every worker
+    process starts its own engine and `MoveAnnotator` once and annotates whole
+    shards, reading its games straight from the PGN offsets. Games that cannot
+    be read are logged and left out. Results come back in the original game
+    order, and only a few shards per worker are in flight at a time, so memory
+    does not depend on the size of the corpus.
+    With `triage`, only critical moves are searched with `limit`, the rest keep
+    the score of a shallow first pass (see `analyse_critical`). A `budget`
+    of wall-clock seconds for the whole corpus replaces `limit`: every game
+    gets an equal share of the engine time of all processes, spread over its
+    positions by `analyse_with_budget`.
+    """
+
+    def __init__(
+        self,
+        pgn_paths,
+        engine_path=r"stockfish.exe",
+        limit=CORPUS_LIMIT,
+        processes=None,
+        shard_size=100,
+        weights=None,
+        k=MAX_POSITIONAL_FEAUTRES,
+        options=None,
+        triage=False,
+        budget=None,
+    ):
+        self.pgn_paths = list(pgn_paths)
+        self.engine_path = engine_path
+        self.limit = limit
+        self.processes = processes or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.weights = weights
+        self.k = k
+        self.options = options or {}
+        self.triage = triage
+        self.budget = budget
+
+    def shards(self):
+        """Yield (pgn path, first game, last game) ranges covering every game, in order."""
+
+        for pgn_path in self.pgn_paths:
+            games = len(PgnIndex(pgn_path))
+            for start in range(1, games + 1, self.shard_size):
+                yield pgn_path, start, min(start + self.shard_size - 1, games)
+
+    def annotate(self):
+        """Yield a `GameAnnotation` for every game, in file and game order, then print the throughput."""
+
+        games = positions = 0
+        started = time.perf_counter()
+        for annotation in self._results():
+            games += 1
+            positions += len(annotation.scores)
+            yield annotation
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"Annotated {games} games ({positions} positions) in {elapsed:.1f} s: "
+            f"{games / elapsed:.2f} games/s, {positions / elapsed:.1f} positions/s."
+        )
+
+    def _results(self):
+        """Run the shards in the pool, keeping two per worker queued, and yield their games in order."""
+
+        initargs = (self.engine_path, self.options, self.weights, self.k)
+        game_budget = None
+        if self.budget is not None:
+            games = sum(len(PgnIndex(pgn_path)) for pgn_path in self.pgn_paths)
+            game_budget = self.budget * self.processes / max(games, 1)
+
+        with ProcessPoolExecutor(self.processes, initializer=_start_worker, initargs=initargs) as executor:
+            pending = deque()
+            for pgn_path, start, stop in self.shards():
+                shard = (pgn_path, start, stop, self.limit, self.triage, game_budget)
+                pending.append(executor.submit(_annotate_shard, *shard))
+                if len(pending) >= 2 * self.processes:
+                    yield from pending.popleft().result()
+
+            while pending:
+                yield from pending.popleft().result()
+
+
+def _start_worker(engine_path, options, weights, k):
+    """Start the engine and annotator of a worker process."""
+
+    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    if options:
+        engine.configure(options)
+    # Worker processes skip atexit handlers but wait for the engine's thread
+    # on exit, so the engine has to be shut down by a multiprocessing finalizer.
+    Finalize(engine, engine.quit, exitpriority=0)
+
+    _worker["engine"] = engine
+    _worker["annotator"] = MoveAnnotator(weights, k)
+    _worker["indexes"] = {}
+
+
+def _annotate_shard(pgn_path, start, stop, limit, triage=False, budget=None):
+    """Evaluate and annotate the mainlines of games `start` to `stop` of a PGN file."""
+
+    engine, annotator = _worker["engine"], _worker["annotator"]
+    if pgn_path not in _worker["indexes"]:
+        _worker["indexes"][pgn_path] = PgnIndex(pgn_path)
+    index = _worker["indexes"][pgn_path]
+
+    annotations = []
+    with open(pgn_path) as pgn_file:
+        for game_number in range(start, stop + 1):
+            pgn_file.seek(index.game_offset(game_number))
+            game = chess.pgn.read_game(pgn_file, Visitor=MainlineVisitor)
+            if game is None:
+                # Only happens if the PGN was cut short after it was indexed.
+                LOGGER.error("No game found at game %d of %s, skipping it.", game_number, pgn_path)
+                continue
+
+            positions = mainline_positions(game)
+            if budget is not None:
+                infos = analyse_with_budget(engine, positions, budget, triage)
+            elif triage:
+                infos = analyse_critical(engine, positions, limit)[0]
+            else:
+                infos = [engine.analyse(board, limit) for board in positions[1:]]
+
+            scores = [info.get("score") for info in infos]
+            annotations.append(GameAnnotation(pgn_path, game_number, scores, annotator.annotate_positions(positions)))
+
+    return annotations
@@ -0,0 +1,58 @@
+from src.pgn.index import PgnIndex
+
+
+class AnnotatedPgnWriter:
+    """Writes games with evaluations and feature comments to a PGN file, one game at a time.
+
+    Every mainline node gets its engine score as a `[%eval ...]` command and
+    its feature comments as text. Each game is written and flushed as soon as
+    it is given, so nothing accumulates in memory while a corpus is exported.
+    Use as a context manager, or call `close` when done.
+    """
+
+    def __init__(self, path, mode="w"):
+        self.path = path
+        self.games = 0
+        self._file = open(path, mode)
+        self._indexes = {}
+
+    def write(self, game, scores, comments):
+        """Annotate the mainline of `game` with a score and a list of comments per move, then write it.
+
+        `scores` are `PovScore`s (or None) and `comments` lists of
+        `FeatureComment`s, both in mainline move order. The game itself is left
+        unchanged.
+        """
+
+        originals = []
+        for node, score, move_comments in zip(game.mainline(), scores, comments):
+            originals.append((node, node.comment))
+            text = " ".join(comment.text for comment in move_comments)
+            node.comment = f"{node.comment} {text}".strip()
+            node.set_eval(score)
+
+        print(game, file=self._file, end="\n\n")
+        self._file.flush()
+        self.games += 1
+
+        # Leave the game as it was given.
+        for node, comment in originals:
+            node.comment = comment
+
+    def write_annotation(self, annotation):
+        """Read the game a `GameAnnotation` describes from its PGN and write it annotated."""
+
+        if annotation.pgn_path not in self._indexes:
+            self._indexes[annotation.pgn_path] = PgnIndex(annotation.pgn_path)
+
+        game = self._indexes[annotation.pgn_path].read_game(annotation.game_number)
+        self.write(game, annotation.scores, annotation.comments)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
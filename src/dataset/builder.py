@@ -0,0 +1,157 @@
+import json
+import os
+
+import chess
+import chess.engine
+import chess.pgn
+import numpy as np
+
+from src.dataset.store import FeatureStore
+from src.engine.triage import MATE_SCORE
+from src.features.batch import feature_matrix
+from src.features.extractor import FEATURES
+from src.features.registry import resolve
+from src.pgn.index import PgnIndex
+from src.pgn.positions import mainline_positions
+from src.pgn.visitor import MainlineVisitor
+
+DATASET_LIMIT = chess.engine.Limit(time=0.05)
+MANIFEST = "manifest.json"
+
+
+class DatasetBuilder:
+    """Streams positions from PGN files into a `FeatureStore` on disk.
+
+    Games are read one at a time, every mainline position gets its features
+    and an engine evaluation, both from the point of view of `color`, and rows
+    are appended to the store in chunks of at least `chunk_size` positions, so
+    memory does not grow with the corpus.
+    Chunks end on game boundaries. `manifest.json` in the output directory
+    records the rows written and the next game to read, so an interrupted build
+    resumes where the last chunk ended.
+    """
+
+    def __init__(
+        self,
+        pgn_paths,
+        output_dir="data/dataset",
+        engine=None,
+        limit=DATASET_LIMIT,
+        color=chess.WHITE,
+        features=FEATURES,
+        chunk_size=100000,
+    ):
+        self.pgn_paths = list(pgn_paths)
+        self.output_dir = output_dir
+        self.engine = engine
+        self.limit = limit
+        self.color = color
+        self.features = resolve(features)
+        self.chunk_size = chunk_size
+
+        self.store = FeatureStore.create(output_dir, self.features)
+        self.manifest_path = os.path.join(output_dir, MANIFEST)
+        self.manifest = self._load_manifest()
+        self.store.truncate(self.manifest["rows"])
+
+    def build(self):
+        """Process every remaining game, writing chunks as they fill up."""
+
+        chunk = []
+        for file_number, pgn_path in enumerate(self.pgn_paths):
+            if file_number < self.manifest["next_file"]:
+                continue
+
+            index = PgnIndex(pgn_path)
+            first_game = self.manifest["next_game"] if file_number == self.manifest["next_file"] else 1
+            for game_number, game in self._read_games(index, first_game):
+                chunk.append(self._game_rows(game, file_number, game_number))
+
+                if sum(len(rows["ply"]) for rows in chunk) >= self.chunk_size:
+                    self._write_chunk(chunk, file_number, game_number + 1)
+                    chunk = []
+
+            print(f"Processed {pgn_path}.")
+            self._write_chunk(chunk, file_number + 1, 1)
+            chunk = []
+
+        print(f"Dataset complete: {len(self.store)} positions.")
+        return self.store
+
+    def _read_games(self, index, first_game):
+        """Yield (game number, game) pairs from `first_game` onwards, mainlines only."""
+
+        if first_game > len(index):
+            return
+
+        with open(index.pgn_path) as pgn_file:
+            pgn_file.seek(index.game_offset(first_game))
+            for game_number in range(first_game, len(index) + 1):
+                game = chess.pgn.read_game(pgn_file, Visitor=MainlineVisitor)
+                if game is None:
+                    break
+                yield game_number, game
+
+    def _game_rows(self, game, file_number, game_number):
+        """Columns of every position after a mainline move that the engine scored."""
+
+        boards = mainline_positions(game)[1:]
+        if not boards:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in self.store.dtypes.items()}
+
+        if hasattr(self.engine, "analyse_many"):
+            infos = self.engine.analyse_many(boards, self.limit)
+        else:
+            infos = [self.engine.analyse(board, self.limit) for board in boards]
+
+        scored = np.array(["score" in info for info in infos])
+        matrix = feature_matrix(boards, self.color, self.features)[scored]
+
+        rows = {feature: matrix[:, i] for i, feature in enumerate(self.features)}
+        rows["evaluation_score"] = np.array(
+            [info["score"].pov(self.color).score(mate_score=MATE_SCORE) for info in infos if "score" in info],
+            dtype=np.int32,
+        )
+        rows["file"] = np.full(len(matrix), file_number)
+        rows["game"] = np.full(len(matrix), game_number)
+        rows["ply"] = np.array([board.ply() for board in boards])[scored]
+        return rows
+
+    def _write_chunk(self, chunk, next_file, next_game):
+        """Append the rows of a chunk of games to the store and record where to continue in the manifest."""
+
+        if chunk:
+            self.store.append({column: np.concatenate([rows[column] for rows in chunk]) for column in self.store.columns})
+            print(f"Wrote {sum(len(rows['ply']) for rows in chunk)} positions to {self.output_dir}.")
+        self._save_manifest(next_file, next_game)
+
+    def _load_manifest(self):
+        """Read the manifest of an earlier build, or start a new one."""
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        settings = {
+            "pgn_paths": self.pgn_paths,
+            "features": self.features,
+            "color": self.color,
+        }
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if any(manifest.get(key) != value for key, value in settings.items()):
+                raise ValueError(f"{self.output_dir} holds a dataset built with different settings.")
+            return manifest
+
+        return dict(settings, rows=0, next_file=0, next_game=1)
+
+    def _save_manifest(self, next_file, next_game):
+        """Atomically replace the manifest, so an interruption never leaves it half written."""
+
+        self.manifest["rows"] = len(self.store)
+        self.manifest["next_file"] = next_file
+        self.manifest["next_game"] = next_game
+
+        temporary_path = f"{self.manifest_path}.tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(temporary_path, self.manifest_path)
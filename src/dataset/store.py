@@ -0,0 +1,138 @@
+import json
+import os
+
+import numpy as np
+
+from src.features.extractor import FEATURES
+
+SCHEMA = "schema.json"
+
+# Storage type of every column. Feature values are small counts, so int8 holds
+# them all except the mobility and connectivity sums, which can pass 127 in
+# positions with several queens.
+COLUMN_DTYPES = {feature: "int8" for feature in FEATURES}
+COLUMN_DTYPES.update(queens_mobility="int16", connectivity="int16")
+COLUMN_DTYPES.update(evaluation_score="int32", file="int16", game="int32", ply="int16")
+
+ID_COLUMNS = ["file", "game", "ply"]
+
+
+class FeatureStore:
+    """Columnar on-disk table of positions, features and evaluations.
+
+    Every column is a raw little-endian array in its own `<column>.bin` file,
+    described by `schema.json` (column types and the row count). Columns are
+    read as read-only memory maps, so opening a store costs nothing and slices
+    of it are views on the file. Rows are only ever appended; the row count in
+    the schema is updated after the data is written, so bytes past it left by
+    an interrupted append are ignored and overwritten by the next one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SCHEMA)) as schema_file:
+            schema = json.load(schema_file)
+
+        self.dtypes = {column: np.dtype(dtype).newbyteorder("<") for column, dtype in schema["columns"].items()}
+        self.rows = schema["rows"]
+        self._columns = {}
+
+    @classmethod
+    def create(cls, path, features=FEATURES):
+        """Create an empty store for `features`, or open the one already at `path`."""
+
+        if not os.path.exists(os.path.join(path, SCHEMA)):
+            os.makedirs(path, exist_ok=True)
+            columns = {column: COLUMN_DTYPES[column] for column in ID_COLUMNS + list(features) + ["evaluation_score"]}
+            _write_schema(path, columns, 0)
+
+        store = cls(path)
+        if store.features != list(features):
+            raise ValueError(f"{path} holds a feature store with different features.")
+        return store
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, column):
+        """Return a column as a read-only array backed by its file."""
+
+        if column not in self.dtypes:
+            raise ValueError(f"No such column exists: {column}.")
+
+        if column not in self._columns:
+            if self.rows:
+                array = np.memmap(self._column_path(column), dtype=self.dtypes[column], mode="r", shape=(self.rows,))
+            else:
+                array = np.empty(0, dtype=self.dtypes[column])
+            self._columns[column] = array
+        return self._columns[column]
+
+    @property
+    def columns(self):
+        return list(self.dtypes)
+
+    @property
+    def features(self):
+        return [column for column in self.dtypes if column not in ID_COLUMNS and column != "evaluation_score"]
+
+    def matrix(self, features=None, rows=slice(None)):
+        """Return the given feature columns of a range of rows as one (rows, features) int16 array."""
+
+        features = self.features if features is None else features
+        return np.column_stack([self[feature][rows] for feature in features]).astype(np.int16, copy=False)
+
+    def append(self, columns):
+        """Append rows given as a dict of equally long arrays, one for every column."""
+
+        missing = set(self.dtypes) - set(columns)
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(sorted(missing))}.")
+
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) != 1:
+            raise ValueError("All columns must have the same length.")
+
+        arrays = {}
+        for column, dtype in self.dtypes.items():
+            values = np.asarray(columns[column])
+            limits = np.iinfo(dtype)
+            if len(values) and (values.min() < limits.min or values.max() > limits.max):
+                raise ValueError(f"Values of {column} do not fit in {dtype}.")
+            arrays[column] = values.astype(dtype, copy=False)
+
+        self._columns.clear()
+        for column, values in arrays.items():
+            with open(self._column_path(column), "ab") as column_file:
+                column_file.truncate(self.rows * values.itemsize)
+                column_file.write(values.tobytes())
+
+        self.rows += lengths.pop()
+        _write_schema(self.path, {column: dtype.name for column, dtype in self.dtypes.items()}, self.rows)
+
+    def truncate(self, rows):
+        """Drop every row from `rows` onwards."""
+
+        if rows > self.rows:
+            raise ValueError(f"The store only has {self.rows} rows.")
+
+        self._columns.clear()
+        for column, dtype in self.dtypes.items():
+            with open(self._column_path(column), "ab") as column_file:
+                column_file.truncate(rows * dtype.itemsize)
+
+        self.rows = rows
+        _write_schema(self.path, {column: dtype.name for column, dtype in self.dtypes.items()}, self.rows)
+
+    def _column_path(self, column):
+        return os.path.join(self.path, f"{column}.bin")
+
+
+def _write_schema(path, columns, rows):
+    """Atomically replace the schema of the store at `path`."""
+
+    schema_path = os.path.join(path, SCHEMA)
+    temporary_path = f"{schema_path}.tmp"
+    with open(temporary_path, "w") as schema_file:
+        json.dump({"columns": columns, "rows": rows}, schema_file, indent=1)
+    os.replace(temporary_path, schema_path)
@@ -0,0 +1,97 @@
+import math
+
+import chess
+import chess.engine
+
+from src.engine.triage import SHALLOW_LIMIT, analyse_positions, critical_moves, white_scores
+
+MINIMUM_TIME = 0.01
+# Evaluation swings above this many centipawns do not make a position any harder.
+MAX_SWING = 300
+# Search times are rounded to steps of a quarter of a doubling, so budgeted
+# searches use a few distinct limits that the evaluation cache can reuse.
+TIME_STEPS_PER_DOUBLING = 4
+
+
+def complexity(board, swing=0):
+    """Relative difficulty of a position for the engine.
+
+    Grows with the number of legal moves, the pieces left on the board and the
+    evaluation swing (in centipawns) that led to the position.
+    """
+
+    pieces = chess.popcount(board.occupied)
+    return (1 + board.legal_moves.count()) * (0.5 + pieces / 32) * (1 + min(abs(swing), MAX_SWING) / 100)
+
+
+def allocate(boards, budget, swings=None, minimum=MINIMUM_TIME):
+    """Split `budget` seconds across positions in proportion to their complexity.
+
+    Every position gets at least `minimum` seconds, unless the budget is too
+    small for that, in which case it is split evenly. Returns a time per board.
+    """
+
+    if not boards:
+        return []
+
+    if budget <= minimum * len(boards):
+        return [budget / len(boards)] * len(boards)
+
+    swings = swings or [0] * len(boards)
+    weights = [complexity(board, swing) for board, swing in zip(boards, swings)]
+    spare = budget - minimum * len(boards)
+    total = sum(weights)
+    return [minimum + spare * weight / total for weight in weights]
+
+
+def round_time(seconds, minimum=MINIMUM_TIME):
+    """Round a search time to the nearest step of a geometric grid starting at `minimum`."""
+
+    if seconds <= 0:
+        return seconds
+
+    step = round(math.log2(seconds / minimum) * TIME_STEPS_PER_DOUBLING)
+    return round(minimum * 2 ** (step / TIME_STEPS_PER_DOUBLING), 6)
+
+
+def analyse_with_budget(engine, positions, budget, triage=False, shallow_limit=SHALLOW_LIMIT):
+    """Analyse the position after every move of a game within `budget` seconds of search time.
+
+    `positions` are the boards of the game from the starting position on.
+    Time goes to complex positions first, so a long game costs about as much
+    as a short one. Search times are rounded by `round_time`. With `triage`,
+    a shallow pass runs first and the search time the engine reports for it
+    counts against the budget: the rest is split among the critical moves only
+    (weighted up by the swing across them) and the other moves keep their
+    shallow scores. Every critical move still gets `MINIMUM_TIME` if the
+    shallow pass used up the budget.
+    """
+
+    if not triage:
+        boards = positions[1:]
+        return _analyse_each(engine, boards, allocate(boards, budget))
+
+    shallow = analyse_positions(engine, positions, shallow_limit)
+    critical = critical_moves(positions, shallow)
+    spent = sum(info.get("time", 0) for info in shallow)
+    remaining = max(budget - spent, MINIMUM_TIME * len(critical))
+
+    scores = white_scores(shallow)
+    swings = [MAX_SWING if None in scores[i : i + 2] else scores[i + 1] - scores[i] for i in critical]
+    boards = [positions[i + 1] for i in critical]
+
+    infos = shallow[1:]
+    for i, info in zip(critical, _analyse_each(engine, boards, allocate(boards, remaining, swings))):
+        infos[i] = info
+    return infos
+
+
+def _analyse_each(engine, boards, times):
+    """Analyse every board with its own time limit, in parallel when the engine can `submit` searches."""
+
+    limits = [chess.engine.Limit(time=round_time(seconds)) for seconds in times]
+    if hasattr(engine, "submit"):
+        futures = [engine.submit(board, limit) for board, limit in zip(boards, limits)]
+        return [future.result() for future in futures]
+
+    return [engine.analyse(board, limit) for board, limit in zip(boards, limits)]
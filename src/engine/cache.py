@@ -0,0 +1,497 @@
+import dataclasses
+import sqlite3
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future
+
+import chess.engine
+import chess.polyglot
+
+COMMIT_INTERVAL = 1000
+# Positions this close to the fifty-move rule are scored by their history.
+HISTORY_HALFMOVES = 80
+
+
+class DominancePolicy:
+    """Decides whether a cached search answers a requested search limit.
+
+    An entry answers a request when it searched at least as deep, as many nodes
+    and as long as asked for. A time limit is also answered by any entry at
+    least as deep as searches with that time limit typically reach, so a depth
+    22 result serves a 0.1 s request. Typical depths come from `time_depths`
+    (seconds -> depth) or, for other times, from the mean depth of observed
+    time-limited searches. Limits with mate or clock fields only match
+    identical searches.
+    """
+
+    def __init__(self, time_depths=None):
+        self.time_depths = dict(time_depths or {})
+        self._observed = {}
+        # Sorted times and the least typical depth of any time at least as long,
+        # rebuilt only when an observation changes a typical depth.
+        self._table = None
+
+    def observe(self, seconds, depth_total, searches=1):
+        """Record the total depth reached by searches limited to `seconds`."""
+
+        count, total = self._observed.get(seconds, (0, 0))
+        self._observed[seconds] = (count + searches, total + depth_total)
+        if count == 0 or -(-total // count) != -(-(total + depth_total) // (count + searches)):
+            self._table = None
+
+    def satisfies(self, entry, limit):
+        """Return whether a cached entry is at least as good as the requested search."""
+
+        if _has_exact_only_fields(limit):
+            return False
+
+        depth = entry.get("depth") or 0
+        if limit.depth is not None and depth < limit.depth:
+            return False
+
+        if limit.nodes is not None and (entry.get("nodes") or 0) < limit.nodes:
+            return False
+
+        if limit.time is not None and (entry.get("time") or 0) < limit.time:
+            required_depth = self.required_depth(limit.time)
+            if required_depth is None or depth < required_depth:
+                return False
+
+        return True
+
+    def required_depth(self, seconds):
+        """Typical depth of searches of at least `seconds`, or None if unknown."""
+
+        if self._table is None:
+            self._table = self._depth_table()
+
+        times, depths = self._table
+        i = bisect_left(times, seconds)
+        return depths[i] if i < len(times) else None
+
+    def _depth_table(self):
+        depths = {time: -(-total // count) for time, (count, total) in self._observed.items()}
+        depths.update(self.time_depths)
+
+        times = sorted(depths)
+        minimums = []
+        for time in reversed(times):
+            minimums.append(min(depths[time], minimums[-1]) if minimums else depths[time])
+        return times, minimums[::-1]
+
+
+class EvaluationCache:
+    """On-disk cache of engine evaluations backed by sqlite3.
+
+    Entries are keyed by the Zobrist hash of the position, the engine name and
+    the search limit, and record the depth, nodes and time the search reached.
+    A lookup returns the exact search if it was cached, otherwise the deepest
+    entry that the `DominancePolicy` accepts for the request. Scores are stored
+    relative to the side to move. Positions whose score depends on the game
+    history (a repetition, or the fifty-move rule drawing near) are neither
+    stored nor looked up.
+
+    MultiPV searches are kept separately, every line with its rank and
+    principal variation, and are only answered by the same search limit with
+    at least as many lines.
+    """
+
+    def __init__(self, path="data/evaluations.sqlite", policy=None):
+        self.path = path
+        self.policy = policy or DominancePolicy()
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS evaluations (
+                position INTEGER NOT NULL,
+                engine TEXT NOT NULL,
+                search TEXT NOT NULL,
+                cp INTEGER,
+                mate INTEGER,
+                depth INTEGER,
+                nodes INTEGER,
+                time REAL,
+                PRIMARY KEY (position, engine, search)
+            ) WITHOUT ROWID
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS time_depths (
+                engine TEXT NOT NULL,
+                time REAL NOT NULL,
+                searches INTEGER NOT NULL,
+                depth_total INTEGER NOT NULL,
+                PRIMARY KEY (engine, time)
+            ) WITHOUT ROWID
+            """
+        )
+
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lines (
+                position INTEGER NOT NULL,
+                engine TEXT NOT NULL,
+                search TEXT NOT NULL,
+                multipv INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                pv TEXT NOT NULL,
+                cp INTEGER,
+                mate INTEGER,
+                depth INTEGER,
+                nodes INTEGER,
+                time REAL,
+                PRIMARY KEY (position, engine, search, multipv, rank)
+            ) WITHOUT ROWID
+            """
+        )
+
+        # Caches written before search statistics were recorded.
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(evaluations)")}
+        for column, kind in (("nodes", "INTEGER"), ("time", "REAL")):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE evaluations ADD COLUMN {column} {kind}")
+
+        self._policies = {}
+        for engine, time, searches, depth_total in self._connection.execute("SELECT * FROM time_depths"):
+            self._policy_for(engine).observe(time, depth_total, searches)
+
+    def get(self, board, limit, engine):
+        """Return a cached info dict answering the search, or None on a miss."""
+
+        if _depends_on_history(board):
+            self.misses += 1
+            return None
+
+        search = _search_key(limit)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT search, cp, mate, depth, nodes, time FROM evaluations WHERE position = ? AND engine = ?",
+                (_position_key(board), engine),
+            ).fetchall()
+
+            entry = None
+            for row in rows:
+                candidate = _entry(board, row)
+                if row[0] == search:
+                    entry = candidate
+                    break
+
+                if self._policy_for(engine).satisfies(candidate, limit):
+                    if entry is None or (candidate.get("depth") or 0) > (entry.get("depth") or 0):
+                        entry = candidate
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return entry
+
+    def put(self, board, limit, engine, info):
+        """Store the result of analysing a position with the given limit."""
+
+        if _depends_on_history(board):
+            return
+
+        relative = info["score"].pov(board.turn)
+        depth = info.get("depth")
+        # A time-limited search used its whole budget even if it reports less.
+        time = limit.time if limit.time is not None else info.get("time")
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _position_key(board),
+                    engine,
+                    _search_key(limit),
+                    relative.score(),
+                    relative.mate(),
+                    depth,
+                    info.get("nodes"),
+                    time,
+                ),
+            )
+
+            if depth is not None and _is_time_only(limit):
+                self._policy_for(engine).observe(limit.time, depth)
+                self._connection.execute(
+                    """
+                    INSERT INTO time_depths VALUES (?, ?, 1, ?)
+                    ON CONFLICT (engine, time) DO UPDATE SET
+                        searches = searches + 1,
+                        depth_total = depth_total + excluded.depth_total
+                    """,
+                    (engine, limit.time, depth),
+                )
+
+            self._pending += 1
+            if self._pending >= COMMIT_INTERVAL:
+                self._commit()
+
+    def get_lines(self, board, limit, engine, multipv):
+        """Return the cached infos of the `multipv` best lines of a search, or None on a miss."""
+
+        if _depends_on_history(board):
+            self.misses += 1
+            return None
+
+        with self._lock:
+            row = self._connection.execute(
+                """
+                SELECT MIN(multipv) FROM lines
+                WHERE position = ? AND engine = ? AND search = ? AND multipv >= ?
+                """,
+                (_position_key(board), engine, _search_key(limit), multipv),
+            ).fetchone()
+
+            if row[0] is None:
+                self.misses += 1
+                return None
+
+            rows = self._connection.execute(
+                """
+                SELECT pv, cp, mate, depth, nodes, time FROM lines
+                WHERE position = ? AND engine = ? AND search = ? AND multipv = ? AND rank <= ?
+                ORDER BY rank
+                """,
+                (_position_key(board), engine, _search_key(limit), row[0], multipv),
+            ).fetchall()
+            self.hits += 1
+
+        infos = []
+        for pv, *fields in rows:
+            info = _entry(board, (None, *fields))
+            info["pv"] = [chess.Move.from_uci(move) for move in pv.split()]
+            info["multipv"] = len(infos) + 1
+            infos.append(info)
+        return infos
+
+    def put_lines(self, board, limit, engine, multipv, infos):
+        """Store every line returned by a search for the `multipv` best lines."""
+
+        if _depends_on_history(board):
+            return
+
+        time = limit.time
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        _position_key(board),
+                        engine,
+                        _search_key(limit),
+                        multipv,
+                        rank,
+                        " ".join(move.uci() for move in info.get("pv", [])),
+                        info["score"].pov(board.turn).score(),
+                        info["score"].pov(board.turn).mate(),
+                        info.get("depth"),
+                        info.get("nodes"),
+                        time if time is not None else info.get("time"),
+                    )
+                    for rank, info in enumerate(infos, 1)
+                ],
+            )
+
+            self._pending += len(infos)
+            if self._pending >= COMMIT_INTERVAL:
+                self._commit()
+
+    def stats(self):
+        """Return the hit and miss counts and the hit rate since the cache was opened."""
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def flush(self):
+        """Commit pending entries to disk."""
+
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """Commit pending entries and close the database."""
+
+        self.flush()
+        self._connection.close()
+
+    def _policy_for(self, engine):
+        """Copy of the configured policy holding the depths observed for one engine."""
+
+        if engine not in self._policies:
+            self._policies[engine] = DominancePolicy(self.policy.time_depths)
+        return self._policies[engine]
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CachedEngine:
+    """Engine wrapper that consults an `EvaluationCache` before analysing.
+
+    Wraps a `SimpleEngine` or an `EnginePool` and can be passed to `ChessGame`
+    wherever an engine is expected.
+    """
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+        self.id = engine.id
+        self.engine_name = self.id.get("name", "unknown")
+
+    def analyse(self, board, limit, **kwargs):
+        """Return the cached result for a position, analysing it on a miss.
+
+        A `multipv` search caches and returns all of its lines.
+        """
+
+        if set(kwargs) == {"multipv"}:
+            return self._analyse_lines(board, limit, kwargs["multipv"])
+
+        if kwargs:
+            return self.engine.analyse(board, limit, **kwargs)
+
+        info = self.cache.get(board, limit, self.engine_name)
+        if info is not None:
+            return info
+
+        info = self.engine.analyse(board, limit)
+        self._store(board, limit, info)
+        return info
+
+    def analyse_many(self, boards, limit):
+        """Analyse positions, sending only cache misses to the engine."""
+
+        infos = [self.cache.get(board, limit, self.engine_name) for board in boards]
+        missing = [i for i, info in enumerate(infos) if info is None]
+
+        missing_boards = [boards[i] for i in missing]
+        if hasattr(self.engine, "analyse_many"):
+            results = self.engine.analyse_many(missing_boards, limit)
+        else:
+            results = [self.engine.analyse(board, limit) for board in missing_boards]
+
+        for i, info in zip(missing, results):
+            self._store(boards[i], limit, info)
+            infos[i] = info
+
+        return infos
+
+    def submit(self, board, limit, **kwargs):
+        """Schedule the analysis of a position and return a future for its info.
+
+        Cache hits come back as completed futures. Misses run on the wrapped
+        engine's `submit` when it has one, so an `EnginePool` still searches
+        them in parallel, and are stored once they finish.
+        """
+
+        if kwargs or not hasattr(self.engine, "submit"):
+            return _completed(self.analyse(board, limit, **kwargs))
+
+        info = self.cache.get(board, limit, self.engine_name)
+        if info is not None:
+            return _completed(info)
+
+        board = board.copy()
+        future = self.engine.submit(board, limit)
+        future.add_done_callback(lambda done: done.exception() is None and self._store(board, limit, done.result()))
+        return future
+
+    def quit(self):
+        """Shut down the wrapped engine and write pending cache entries."""
+
+        self.cache.flush()
+        self.engine.quit()
+
+    def _analyse_lines(self, board, limit, multipv):
+        infos = self.cache.get_lines(board, limit, self.engine_name, multipv)
+        if infos is not None:
+            return infos
+
+        infos = self.engine.analyse(board, limit, multipv=multipv)
+        if infos and all("score" in info for info in infos):
+            self.cache.put_lines(board, limit, self.engine_name, multipv, infos)
+        return infos
+
+    def _store(self, board, limit, info):
+        if "score" in info:
+            self.cache.put(board, limit, self.engine_name, info)
+
+
+def _completed(result):
+    """A future that already holds `result`."""
+
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _entry(board, row):
+    """Build an info dict from a cached row."""
+
+    _, cp, mate, depth, nodes, time = row
+    relative = chess.engine.Cp(cp) if mate is None else chess.engine.Mate(mate)
+    entry = {"score": chess.engine.PovScore(relative, board.turn)}
+
+    for key, value in (("depth", depth), ("nodes", nodes), ("time", time)):
+        if value is not None:
+            entry[key] = value
+    return entry
+
+
+def _depends_on_history(board):
+    """Whether the score of a position may differ with the moves that led to it."""
+
+    return board.halfmove_clock >= HISTORY_HALFMOVES or board.is_repetition(2)
+
+
+def _is_time_only(limit):
+    """Whether time is the only field set on a search limit."""
+
+    return limit.time is not None and limit.depth is None and limit.nodes is None and not _has_exact_only_fields(limit)
+
+
+def _has_exact_only_fields(limit):
+    """Whether a limit uses fields that cannot be compared by search effort."""
+
+    return any(
+        getattr(limit, field) is not None
+        for field in ("mate", "white_clock", "black_clock", "white_inc", "black_inc", "remaining_moves", "clock_id")
+    )
+
+
+def _position_key(board):
+    """Zobrist hash of a position as a signed 64-bit integer for sqlite."""
+
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _search_key(limit):
+    """Canonical text form of the fields set on a search limit."""
+
+    return ";".join(
+        f"{field.name}={getattr(limit, field.name)}"
+        for field in dataclasses.fields(limit)
+        if getattr(limit, field.name) is not None
+    )
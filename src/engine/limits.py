@@ -0,0 +1,4 @@
+import chess.engine
+
+# Search limit for analysing a single position, shared by `ChessGame` and `AsyncChessGame`.
+ANALYSIS_LIMIT = chess.engine.Limit(time=0.1)
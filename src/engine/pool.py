@@ -0,0 +1,138 @@
+import asyncio
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import chess.engine
+
+
+class EnginePool:
+    """Pool of UCI engine processes that analyse positions in parallel.
+
+    Every position is dispatched to whichever engine is free. The pool can be
+    used in place of a single `SimpleEngine`, as it offers the same `analyse`
+    and `quit` methods.
+    """
+
+    def __init__(self, engine_path=r"stockfish.exe", size=None, options=None):
+        self.engine_path = engine_path
+        self.options = options or {}
+        self.size = size or os.cpu_count() or 1
+
+        engines = [self._spawn() for _ in range(self.size)]
+        self.id = engines[0].id
+
+        self._idle = queue.Queue()
+        for engine in engines:
+            self._idle.put(engine)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="engine-pool")
+
+    def analyse(self, board, limit, **kwargs):
+        """Analyse a position on the next free engine, blocking until one is available."""
+
+        engine = self._idle.get()
+        try:
+            return engine.analyse(board, limit, **kwargs)
+        except chess.engine.EngineTerminatedError:
+            engine = self._spawn()
+            raise
+        finally:
+            self._idle.put(engine)
+
+    def submit(self, board, limit, **kwargs):
+        """Schedule the analysis of a position and return a future for its info."""
+
+        return self._executor.submit(self.analyse, board.copy(), limit, **kwargs)
+
+    def analyse_many(self, boards, limit, **kwargs):
+        """Analyse positions in parallel, returning their infos in input order."""
+
+        futures = [self.submit(board, limit, **kwargs) for board in boards]
+        return [future.result() for future in futures]
+
+    def quit(self):
+        """Wait for pending analyses and shut down every engine process."""
+
+        self._executor.shutdown(wait=True)
+        while not self._idle.empty():
+            self._idle.get().quit()
+
+    def _spawn(self):
+        """Start and configure a single engine process."""
+
+        engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        if self.options:
+            engine.configure(self.options)
+        return engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+
+class AsyncEnginePool:
+    """Asyncio counterpart of `EnginePool` built on `chess.engine.popen_uci`.
+
+    A UCI protocol cancels its running command when it receives a new one, so
+    every engine is handed to one coroutine at a time. Use as
+    `async with AsyncEnginePool(...) as pool:` or call `start()`/`quit()`.
+    """
+
+    def __init__(self, engine_path=r"stockfish.exe", size=None, options=None):
+        self.engine_path = engine_path
+        self.options = options or {}
+        self.size = size or os.cpu_count() or 1
+        self.id = None
+        self._idle = None
+
+    async def start(self):
+        """Start and configure the engine processes."""
+
+        engines = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        self.id = engines[0].id
+
+        self._idle = asyncio.Queue()
+        for engine in engines:
+            self._idle.put_nowait(engine)
+        return self
+
+    async def analyse(self, board, limit, **kwargs):
+        """Analyse a position on the next free engine, waiting until one is available."""
+
+        engine = await self._idle.get()
+        try:
+            return await engine.analyse(board, limit, **kwargs)
+        except chess.engine.EngineTerminatedError:
+            engine = await self._spawn()
+            raise
+        finally:
+            self._idle.put_nowait(engine)
+
+    async def analyse_many(self, boards, limit, **kwargs):
+        """Analyse positions concurrently, returning their infos in input order."""
+
+        return await asyncio.gather(*(self.analyse(board, limit, **kwargs) for board in boards))
+
+    async def quit(self):
+        """Shut down every engine process once it is idle."""
+
+        for _ in range(self.size):
+            engine = await self._idle.get()
+            await engine.quit()
+
+    async def _spawn(self):
+        """Start and configure a single engine process."""
+
+        _, engine = await chess.engine.popen_uci(self.engine_path)
+        if self.options:
+            await engine.configure(self.options)
+        return engine
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.quit()
@@ -0,0 +1,65 @@
+import chess
+import chess.engine
+
+SHALLOW_LIMIT = chess.engine.Limit(depth=8)
+SWING_THRESHOLD = 100
+MATE_SCORE = 10000
+
+
+def analyse_critical(engine, positions, limit, shallow_limit=SHALLOW_LIMIT, threshold=SWING_THRESHOLD):
+    """Analyse a game in two passes, spending `limit` only on its critical moves.
+
+    `positions` are the boards of a game from the starting position on. A
+    shallow pass scores all of them, then only the positions after critical
+    moves are searched again with `limit`. Returns an info per move (deep for
+    critical moves, shallow otherwise) and the indexes of the critical moves.
+    """
+
+    shallow = analyse_positions(engine, positions, shallow_limit)
+    critical = critical_moves(positions, shallow, threshold)
+
+    infos = shallow[1:]
+    for i, info in zip(critical, analyse_positions(engine, [positions[i + 1] for i in critical], limit)):
+        infos[i] = info
+    return infos, critical
+
+
+def critical_moves(positions, infos, threshold=SWING_THRESHOLD):
+    """Indexes of the moves worth a deep search, given an info for every position.
+
+    A move is critical when the evaluation from white's point of view swings
+    by more than `threshold` centipawns across it, or when either score is
+    missing. Forced moves, the only legal move in their position, never are.
+    """
+
+    scores = white_scores(infos)
+
+    critical = []
+    for i, board in enumerate(positions[:-1]):
+        if _is_forced(board):
+            continue
+
+        before, after = scores[i], scores[i + 1]
+        if before is None or after is None or abs(after - before) > threshold:
+            critical.append(i)
+    return critical
+
+
+def white_scores(infos):
+    """Centipawn scores of infos from white's point of view, None where an info has no score."""
+
+    return [info["score"].white().score(mate_score=MATE_SCORE) if "score" in info else None for info in infos]
+
+
+def analyse_positions(engine, boards, limit):
+    """Analyse positions, in parallel when the engine supports it."""
+
+    if hasattr(engine, "analyse_many"):
+        return engine.analyse_many(boards, limit)
+
+    return [engine.analyse(board, limit) for board in boards]
+
+
+def _is_forced(board):
+    moves = iter(board.legal_moves)
+    return next(moves, None) is not None and next(moves, None) is None
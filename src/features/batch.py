@@ -0,0 +1,336 @@
+from functools import cached_property
+
+import chess
+import numpy as np
+
+from src.features.extractor import FEATURES, FIANCHETTO_KING, FIANCHETTO_QUEEN
+from src.features.registry import resolve
+
+U64 = np.uint64
+
+BB_ALL = U64(chess.BB_ALL)
+NOT_FILE_A = U64(chess.BB_ALL & ~chess.BB_FILE_A)
+NOT_FILE_H = U64(chess.BB_ALL & ~chess.BB_FILE_H)
+NOT_FILE_AB = U64(chess.BB_ALL & ~chess.BB_FILE_A & ~chess.BB_FILE_B)
+NOT_FILE_GH = U64(chess.BB_ALL & ~chess.BB_FILE_G & ~chess.BB_FILE_H)
+CENTER = U64(chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5)
+
+# (shift, wrap mask) of every ray direction; positive shifts move towards h8.
+ORTHOGONAL = [(8, BB_ALL), (-8, BB_ALL), (1, NOT_FILE_A), (-1, NOT_FILE_H)]
+DIAGONAL = [(9, NOT_FILE_A), (7, NOT_FILE_H), (-7, NOT_FILE_A), (-9, NOT_FILE_H)]
+KING_STEPS = ORTHOGONAL + DIAGONAL
+KNIGHT_STEPS = [
+    (17, NOT_FILE_A),
+    (15, NOT_FILE_H),
+    (10, NOT_FILE_AB),
+    (6, NOT_FILE_GH),
+    (-6, NOT_FILE_AB),
+    (-10, NOT_FILE_GH),
+    (-15, NOT_FILE_A),
+    (-17, NOT_FILE_H),
+]
+SIDEWAYS = [(1, NOT_FILE_A), (-1, NOT_FILE_H)]
+PAWN_CAPTURES = {chess.WHITE: [(9, NOT_FILE_A), (7, NOT_FILE_H)], chess.BLACK: [(-7, NOT_FILE_A), (-9, NOT_FILE_H)]}
+
+BACKRANK = {chess.WHITE: 0, chess.BLACK: 56}
+
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+BOARD_FIELDS = ["pawns", "knights", "bishops", "rooks", "queens", "kings", "white", "black", "castling", "ep"]
+
+
+def board_arrays(boards):
+    """Collect the bitboards of many positions into uint64 arrays, one per field.
+
+    Also returns the side to move as a bool array under "turn".
+    """
+
+    rows = [
+        (
+            board.pawns,
+            board.knights,
+            board.bishops,
+            board.rooks,
+            board.queens,
+            board.kings,
+            board.occupied_co[chess.WHITE],
+            board.occupied_co[chess.BLACK],
+            board.clean_castling_rights(),
+            chess.BB_SQUARES[board.ep_square] if board.ep_square else 0,
+        )
+        for board in boards
+    ]
+
+    matrix = np.array(rows, dtype=np.uint64).reshape(len(rows), len(BOARD_FIELDS))
+    arrays = {field: matrix[:, i] for i, field in enumerate(BOARD_FIELDS)}
+    arrays["turn"] = np.fromiter((board.turn for board in boards), dtype=bool, count=len(rows))
+    return arrays
+
+
+def feature_matrix(boards, color=chess.WHITE, features=FEATURES):
+    """Return the positional features of `color` for many positions at once.
+
+    The result has one row per board and one column per requested feature, in
+    the order given (by default every name in `FEATURES`), with the same values
+    as `PositionFeatures`. Only the requested columns and the intermediate
+    results they share are computed. All work after collecting the bitboards
+    is vectorized over positions. Standard chess only.
+    """
+
+    features = resolve(features)
+    boards = list(boards)
+    if not boards:
+        return np.zeros((0, len(features)), dtype=np.int16)
+
+    return BatchFeatures(board_arrays(boards), color).matrix(features)
+
+
+def feature_matrices(boards, features=FEATURES):
+    """Return the feature matrices of both colors, keyed by color, collecting the bitboards once."""
+
+    features = resolve(features)
+    boards = list(boards)
+    if not boards:
+        return {color: np.zeros((0, len(features)), dtype=np.int16) for color in chess.COLORS}
+
+    arrays = board_arrays(boards)
+    return {color: BatchFeatures(arrays, color).matrix(features) for color in chess.COLORS}
+
+
+class BatchFeatures:
+    """Positional features of one side for many positions, one array per feature.
+
+    Vectorized counterpart of `PositionFeatures` over the output of
+    `board_arrays`. Features and the intermediate results they share are
+    evaluated lazily.
+    """
+
+    def __init__(self, arrays, color):
+        self.arrays = arrays
+        self.color = color
+
+        self.ours = arrays["white"] if color == chess.WHITE else arrays["black"]
+        self.theirs = arrays["black"] if color == chess.WHITE else arrays["white"]
+        self.occupied = self.ours | self.theirs
+        self.empty = ~self.occupied
+        self.our_pawns = arrays["pawns"] & self.ours
+        self.their_pawns = arrays["pawns"] & self.theirs
+        self.king = arrays["kings"] & self.ours
+        self.forward = 8 if color == chess.WHITE else -8
+
+    def matrix(self, features=FEATURES):
+        """Return the requested features as an int16 array with one column per feature."""
+
+        return np.stack([np.asarray(getattr(self, feature)).astype(np.int16) for feature in features], axis=1)
+
+    @cached_property
+    def ring(self):
+        return _leaper_attacks(self.king, KING_STEPS)
+
+    @cached_property
+    def attacked(self):
+        """Squares attacked by the opponent with our king lifted off the board, as used for king moves."""
+
+        arrays = self.arrays
+        return _attacks(
+            arrays["pawns"],
+            arrays["knights"],
+            arrays["bishops"],
+            arrays["rooks"],
+            arrays["queens"],
+            arrays["kings"],
+            self.theirs,
+            not self.color,
+            ~(self.occupied ^ self.king),
+        )
+
+    @cached_property
+    def king_mobility(self):
+        castling = _castling_moves(self.arrays["castling"], self.occupied, self.attacked, self.color)
+        return _popcount(self.ring & ~self.ours & ~self.attacked) + castling
+
+    @cached_property
+    def king_centrality(self):
+        square = np.log2(self.king.astype(np.float64)).astype(np.int64)
+        rank, file = square >> 3, square & 7
+        return 3 - np.minimum.reduce([7 - rank, rank, 7 - file, file])
+
+    @cached_property
+    def king_attackers_looking_at_ring_1(self):
+        arrays, ring, theirs = self.arrays, self.ring, self.theirs
+        attackers = (
+            (_leaper_attacks(ring, PAWN_CAPTURES[self.color]) & self.their_pawns)
+            | (_leaper_attacks(ring, KNIGHT_STEPS) & arrays["knights"] & theirs)
+            | (_leaper_attacks(ring, KING_STEPS) & arrays["kings"] & theirs)
+            | (_slider_attacks(ring, self.empty, DIAGONAL) & (arrays["bishops"] | arrays["queens"]) & theirs)
+            | (_slider_attacks(ring, self.empty, ORTHOGONAL) & (arrays["rooks"] | arrays["queens"]) & theirs)
+        )
+        return _popcount(attackers)
+
+    @cached_property
+    def king_defenders_at_ring_1(self):
+        return _popcount(self.ring & self.ours)
+
+    @cached_property
+    def checked(self):
+        return (self.arrays["turn"] == self.color) & ((self.attacked & self.king) != 0)
+
+    @cached_property
+    def castling_rights(self):
+        backrank = U64(chess.BB_RANK_1 if self.color == chess.WHITE else chess.BB_RANK_8)
+        return (self.arrays["castling"] & backrank) != 0
+
+    @cached_property
+    def passed_pawns(self):
+        behind_their_pawns = _fill(_shift(self.their_pawns, -self.forward), -self.forward)
+        stoppers = behind_their_pawns | _leaper_attacks(behind_their_pawns, SIDEWAYS)
+        return _popcount(self.our_pawns & ~stoppers)
+
+    @cached_property
+    def isolated_pawns(self):
+        our_files = _fill(_fill(self.our_pawns, 8), -8)
+        return _popcount(self.our_pawns & ~_leaper_attacks(our_files, SIDEWAYS))
+
+    @cached_property
+    def blocked_pawns(self):
+        them = not self.color
+        blocked = self.our_pawns & _shift(self.theirs, -self.forward)
+        capturers = _leaper_attacks(self.theirs, PAWN_CAPTURES[them])
+        ep_rank = U64(chess.BB_RANK_5 if self.color == chess.WHITE else chess.BB_RANK_4)
+        ep_capturers = _leaper_attacks(self.arrays["ep"] & self.empty, PAWN_CAPTURES[them]) & ep_rank
+        return _popcount(blocked & ~capturers & ~ep_capturers)
+
+    @cached_property
+    def central_pawns(self):
+        return _popcount(self.our_pawns & CENTER)
+
+    @cached_property
+    def bishop_pair(self):
+        return _popcount(self.arrays["bishops"] & self.ours) > 1
+
+    @cached_property
+    def fianchetto_queen(self):
+        return _fianchetto(self.arrays["bishops"] & self.ours, self.our_pawns, *FIANCHETTO_QUEEN[self.color])
+
+    @cached_property
+    def fianchetto_king(self):
+        return _fianchetto(self.arrays["bishops"] & self.ours, self.our_pawns, *FIANCHETTO_KING[self.color])
+
+    @cached_property
+    def queens_mobility(self):
+        # A square is reached by at most one slider per direction, so summing
+        # per-direction counts equals summing per-piece counts.
+        queens = self.arrays["queens"] & self.ours
+        return sum(_popcount(_ray_attacks(queens, self.empty, shift, mask) & ~self.ours) for shift, mask in KING_STEPS)
+
+    @cached_property
+    def open_files_rooks_count(self):
+        pawn_files = _fill(_fill(self.arrays["pawns"], 8), -8)
+        return _popcount(self.arrays["rooks"] & self.ours & ~pawn_files)
+
+    @cached_property
+    def connected_rooks(self):
+        rooks = self.arrays["rooks"] & self.ours
+        return _popcount(_slider_attacks(rooks, self.empty, ORTHOGONAL) & rooks) > 1
+
+    @cached_property
+    def connectivity(self):
+        arrays, ours = self.arrays, self.ours
+        connectivity = sum(
+            _popcount(_shift(self.our_pawns, shift) & mask & ours) for shift, mask in PAWN_CAPTURES[self.color]
+        )
+        connectivity += sum(
+            _popcount(_shift(arrays["knights"] & ours, shift) & mask & ours) for shift, mask in KNIGHT_STEPS
+        )
+        connectivity += sum(_popcount(_shift(self.king, shift) & mask & ours) for shift, mask in KING_STEPS)
+        for sliders, directions in (
+            ((arrays["bishops"] | arrays["queens"]) & ours, DIAGONAL),
+            ((arrays["rooks"] | arrays["queens"]) & ours, ORTHOGONAL),
+        ):
+            connectivity += sum(
+                _popcount(_ray_attacks(sliders, self.empty, shift, mask) & ours) for shift, mask in directions
+            )
+        return connectivity
+
+
+def _castling_moves(castling, occupied, attacked, color):
+    """Number of legal castling moves per position if it were `color`'s move."""
+
+    base = BACKRANK[color]
+    king = U64(1 << (base + 4))
+    moves = np.zeros(castling.shape, dtype=np.int64)
+
+    for rook, between, path in (
+        (base + 7, (base + 5, base + 6), (base + 4, base + 5, base + 6)),
+        (base + 0, (base + 1, base + 2, base + 3), (base + 2, base + 3, base + 4)),
+    ):
+        between_mask = U64(sum(1 << square for square in between))
+        path_mask = U64(sum(1 << square for square in path))
+        legal = (
+            ((castling & U64(1 << rook)) != 0)
+            & ((occupied & king) != 0)
+            & ((occupied & between_mask) == 0)
+            & ((attacked & path_mask) == 0)
+        )
+        moves += legal
+    return moves
+
+
+def _fianchetto(bishops, pawns, bishop, pawn_1, pawn_2):
+    pawn_mask = U64((1 << pawn_1) | (1 << pawn_2))
+    return ((bishops & U64(1 << bishop)) != 0) & ((pawns & pawn_mask) == pawn_mask)
+
+
+def _attacks(pawns, knights, bishops, rooks, queens, kings, side, color, empty):
+    """All squares attacked by `side` (of `color`), with sliders blocked by non-empty squares."""
+
+    return (
+        _leaper_attacks(pawns & side, PAWN_CAPTURES[color])
+        | _leaper_attacks(knights & side, KNIGHT_STEPS)
+        | _leaper_attacks(kings & side, KING_STEPS)
+        | _slider_attacks((bishops | queens) & side, empty, DIAGONAL)
+        | _slider_attacks((rooks | queens) & side, empty, ORTHOGONAL)
+    )
+
+
+def _leaper_attacks(pieces, steps):
+    attacks = np.zeros_like(pieces)
+    for shift, mask in steps:
+        attacks |= _shift(pieces, shift) & mask
+    return attacks
+
+
+def _slider_attacks(sliders, empty, directions):
+    attacks = np.zeros_like(sliders)
+    for shift, mask in directions:
+        attacks |= _ray_attacks(sliders, empty, shift, mask)
+    return attacks
+
+
+def _ray_attacks(sliders, empty, shift, mask):
+    """Kogge-Stone occluded fill: squares attacked along one direction."""
+
+    propagate = empty & mask
+    sliders = sliders | (propagate & _shift(sliders, shift))
+    propagate = propagate & _shift(propagate, shift)
+    sliders = sliders | (propagate & _shift(sliders, 2 * shift))
+    propagate = propagate & _shift(propagate, 2 * shift)
+    sliders = sliders | (propagate & _shift(sliders, 4 * shift))
+    return _shift(sliders, shift) & mask
+
+
+def _fill(bitboards, shift):
+    """Smear every bit along a file (shift of +-8) up to the board edge."""
+
+    bitboards = bitboards | _shift(bitboards, shift)
+    bitboards = bitboards | _shift(bitboards, 2 * shift)
+    return bitboards | _shift(bitboards, 4 * shift)
+
+
+def _shift(bitboards, shift):
+    return bitboards << U64(shift) if shift > 0 else bitboards >> U64(-shift)
+
+
+def _popcount(bitboards):
+    bitboards = np.ascontiguousarray(bitboards, dtype=np.uint64)
+    return POPCOUNT_8[bitboards.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int64)
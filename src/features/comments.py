@@ -1,3 +1,5 @@
+MAX_POSITIONAL_FEAUTRES = 5
+
 BASE_COMMENTS = {
     "king_mobility": {
         "positive": "This move improves king mobility.",
@@ -0,0 +1,347 @@
+from functools import cached_property
+
+import chess
+
+from src.features.chevy import (
+    CHEVY_BOARD_FEATURES,
+    CHEVY_KING_FEATURES,
+    CHEVY_PAWN_FEATURES,
+)
+
+FEATURES = CHEVY_KING_FEATURES + CHEVY_PAWN_FEATURES + CHEVY_BOARD_FEATURES
+
+BB_CENTER = chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5
+
+BB_ADJACENT_FILES = [
+    (chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+    for file in range(8)
+]
+
+
+def _passed_span(square, color):
+    """Squares where an enemy pawn stops a pawn of `color` on `square` from being passed."""
+
+    rank = chess.square_rank(square)
+    ahead = range(rank + 1, 8) if color == chess.WHITE else range(rank)
+    files = chess.BB_FILES[chess.square_file(square)] | BB_ADJACENT_FILES[chess.square_file(square)]
+    return files & sum(chess.BB_RANKS[r] for r in ahead)
+
+
+BB_PASSED_SPANS = {color: [_passed_span(square, color) for square in chess.SQUARES] for color in chess.COLORS}
+
+# (bishop, pawn, pawn) squares of a fianchetto per color.
+FIANCHETTO_QUEEN = {chess.WHITE: (chess.B2, chess.A2, chess.B3), chess.BLACK: (chess.B7, chess.A7, chess.B6)}
+FIANCHETTO_KING = {chess.WHITE: (chess.G2, chess.H2, chess.G3), chess.BLACK: (chess.G7, chess.H7, chess.G6)}
+
+
+class PositionFeatures:
+    """Positional features of one side, computed in a single pass over bitboards.
+
+    Reproduces the values of chevy's `KingSafety`, `PawnStructure` and
+    `BoardFeatures` for every feature in `src/features/chevy.py`, with lists
+    summed and booleans as ints like `ChessGame._print_features`. Occupancy,
+    per-piece attacks and the king zone are computed once and shared by all
+    features, which are evaluated lazily. Pawn-only features are looked up in
+    `pawn_table` (a `PawnHashTable`) when one is given. With a `BoardAnalysis`
+    shared by both sides, the king features read the opponent's attacks from
+    it instead of probing the king zone square by square.
+    """
+
+    def __init__(self, board, color, pawn_table=None, analysis=None):
+        self.board = board
+        self.color = color
+        self.pawn_table = pawn_table
+        self.analysis = analysis
+
+        self.ours = board.occupied_co[color]
+        self.theirs = board.occupied_co[not color]
+        self.our_pawns = board.pawns & self.ours
+        self.their_pawns = board.pawns & self.theirs
+        self.king = board.king(color)
+        self.king_ring = chess.BB_KING_ATTACKS[self.king]
+
+    def values(self, features=FEATURES):
+        """Return the requested features as a dict of ints."""
+
+        return {feature: getattr(self, feature) for feature in features}
+
+    @cached_property
+    def our_attacks(self):
+        """Attack mask of every piece of ours, keyed by square."""
+
+        if self.analysis is not None:
+            return self.analysis.attacks(self.color)
+        return {square: self.board.attacks_mask(square) for square in chess.scan_forward(self.ours)}
+
+    @cached_property
+    def pawn_structure(self):
+        """Pawn-only features, looked up in the pawn table when there is one."""
+
+        if self.pawn_table is None:
+            return self._pawn_only_features()
+        return self.pawn_table.get(self.our_pawns, self.their_pawns, self.color, self._pawn_only_features)
+
+    @cached_property
+    def king_mobility(self):
+        if self.analysis is not None:
+            attacked = self.analysis.attacked_by(not self.color) | self._attacked_behind_king()
+            return chess.popcount(self.king_ring & ~self.ours & ~attacked) + self._castling_moves_count()
+
+        board = self.board
+        occupied = board.occupied ^ chess.BB_SQUARES[self.king]
+
+        mobility = 0
+        for square in chess.scan_forward(self.king_ring & ~self.ours):
+            if not _attackers_mask(board, not self.color, square, occupied):
+                mobility += 1
+
+        return mobility + self._castling_moves_count()
+
+    @cached_property
+    def king_centrality(self):
+        rank, file = chess.square_rank(self.king), chess.square_file(self.king)
+        return 3 - min(7 - rank, rank, 7 - file, file)
+
+    @cached_property
+    def king_attackers_looking_at_ring_1(self):
+        if self.analysis is not None:
+            return sum(1 for attacks in self.analysis.attacks(not self.color).values() if attacks & self.king_ring)
+
+        attackers = 0
+        for square in chess.scan_forward(self.king_ring):
+            attackers |= self.board.attackers_mask(not self.color, square)
+        return chess.popcount(attackers)
+
+    @cached_property
+    def king_defenders_at_ring_1(self):
+        return chess.popcount(self.king_ring & self.ours)
+
+    @cached_property
+    def checked(self):
+        if self.analysis is not None:
+            king = chess.BB_SQUARES[self.king]
+            return int(self.board.turn == self.color and bool(self.analysis.attacked_by(not self.color) & king))
+
+        return int(self.board.turn == self.color and self.board.is_check())
+
+    @cached_property
+    def castling_rights(self):
+        return int(self.board.has_castling_rights(self.color))
+
+    @cached_property
+    def passed_pawns(self):
+        return self.pawn_structure["passed_pawns"]
+
+    @cached_property
+    def isolated_pawns(self):
+        return self.pawn_structure["isolated_pawns"]
+
+    @cached_property
+    def blocked_pawns(self):
+        forward = 8 if self.color == chess.WHITE else -8
+        ep_capturers = self._en_passant_capturers()
+
+        blocked = 0
+        for square in chess.scan_forward(self.our_pawns):
+            if not chess.BB_SQUARES[square + forward] & self.theirs:
+                continue
+            if chess.BB_PAWN_ATTACKS[self.color][square] & self.theirs:
+                continue
+            if chess.BB_SQUARES[square] & ep_capturers:
+                continue
+            blocked += 1
+        return blocked
+
+    @cached_property
+    def central_pawns(self):
+        return self.pawn_structure["central_pawns"]
+
+    @cached_property
+    def bishop_pair(self):
+        return int(chess.popcount(self.board.bishops & self.ours) > 1)
+
+    @cached_property
+    def fianchetto_queen(self):
+        return self._is_fianchetto(*FIANCHETTO_QUEEN[self.color])
+
+    @cached_property
+    def fianchetto_king(self):
+        return self._is_fianchetto(*FIANCHETTO_KING[self.color])
+
+    @cached_property
+    def queens_mobility(self):
+        return sum(
+            chess.popcount(self.our_attacks[square] & ~self.ours)
+            for square in chess.scan_forward(self.board.queens & self.ours)
+        )
+
+    @cached_property
+    def open_files_rooks_count(self):
+        pawns = self.board.pawns
+        return sum(
+            1
+            for square in chess.scan_forward(self.board.rooks & self.ours)
+            if not pawns & chess.BB_FILES[chess.square_file(square)]
+        )
+
+    @cached_property
+    def connected_rooks(self):
+        rooks = self.board.rooks & self.ours
+        attacks = 0
+        for square in chess.scan_forward(rooks):
+            attacks |= self.our_attacks[square]
+        return int(chess.popcount(attacks & rooks) > 1)
+
+    @cached_property
+    def connectivity(self):
+        return sum(chess.popcount(attacks & self.ours) for attacks in self.our_attacks.values())
+
+    def _pawn_only_features(self):
+        """Features that depend on nothing but the pawns of both sides."""
+
+        spans = BB_PASSED_SPANS[self.color]
+        passed = sum(1 for square in chess.scan_forward(self.our_pawns) if not spans[square] & self.their_pawns)
+
+        isolated = 0
+        for file, bb_file in enumerate(chess.BB_FILES):
+            if not self.our_pawns & BB_ADJACENT_FILES[file]:
+                isolated += chess.popcount(self.our_pawns & bb_file)
+
+        return {
+            "passed_pawns": passed,
+            "isolated_pawns": isolated,
+            "central_pawns": chess.popcount(self.our_pawns & BB_CENTER),
+        }
+
+    def _is_fianchetto(self, bishop, pawn_1, pawn_2):
+        board = self.board
+        return int(
+            bool(board.bishops & self.ours & chess.BB_SQUARES[bishop])
+            and bool(self.our_pawns & chess.BB_SQUARES[pawn_1])
+            and bool(self.our_pawns & chess.BB_SQUARES[pawn_2])
+        )
+
+    def _en_passant_capturers(self):
+        """Our pawns that could capture en passant if it were our move."""
+
+        board = self.board
+        ep_square = board.ep_square
+        if not ep_square or chess.BB_SQUARES[ep_square] & board.occupied:
+            return 0
+
+        return (
+            self.our_pawns
+            & chess.BB_PAWN_ATTACKS[not self.color][ep_square]
+            & chess.BB_RANKS[4 if self.color == chess.WHITE else 3]
+        )
+
+    def _attacked_behind_king(self):
+        """Ring squares that enemy sliders checking the king would attack once the king steps off its line."""
+
+        board = self.board
+        behind = 0
+        for square, attacks in self.analysis.attacks(not self.color).items():
+            if attacks & chess.BB_SQUARES[self.king] and chess.BB_SQUARES[square] & (
+                board.bishops | board.rooks | board.queens
+            ):
+                line = chess.ray(square, self.king) & ~chess.between(square, self.king) & ~chess.BB_SQUARES[square]
+                behind |= line & self.king_ring
+        return behind
+
+    def _castling_moves_count(self):
+        """Number of castling moves that would be legal if it were our move."""
+
+        board = self.board
+        backrank = chess.BB_RANK_1 if self.color == chess.WHITE else chess.BB_RANK_8
+        king = self.ours & board.kings & ~board.promoted & backrank
+        if not king:
+            return 0
+
+        king_square = chess.msb(king)
+        count = 0
+        for candidate in chess.scan_reversed(board.clean_castling_rights() & backrank):
+            rook = chess.BB_SQUARES[candidate]
+            a_side = rook < king
+            king_to = (chess.BB_FILE_C if a_side else chess.BB_FILE_G) & backrank
+            rook_to = (chess.BB_FILE_D if a_side else chess.BB_FILE_F) & backrank
+
+            king_path = chess.between(king_square, chess.msb(king_to))
+            rook_path = chess.between(candidate, chess.msb(rook_to))
+
+            if (board.occupied ^ king ^ rook) & (king_path | rook_path | king_to | rook_to):
+                continue
+            if self._attacked(king_path | king, board.occupied ^ king):
+                continue
+            if self._attacked(king_to, board.occupied ^ king ^ rook ^ rook_to):
+                continue
+            count += 1
+        return count
+
+    def _attacked(self, path, occupied):
+        return any(
+            _attackers_mask(self.board, not self.color, square, occupied) for square in chess.scan_reversed(path)
+        )
+
+
+class BoardAnalysis:
+    """Color-independent analysis of a position shared by the features of both sides.
+
+    The attack masks of every piece are computed once; each side's masks serve
+    its own board features and the other side's king safety.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self._attacks = {}
+        self._attacked_by = {}
+
+    def attacks(self, color):
+        """Attack mask of every piece of `color`, keyed by square."""
+
+        if color not in self._attacks:
+            board = self.board
+            self._attacks[color] = {
+                square: board.attacks_mask(square) for square in chess.scan_forward(board.occupied_co[color])
+            }
+        return self._attacks[color]
+
+    def attacked_by(self, color):
+        """Squares attacked by at least one piece of `color`."""
+
+        if color not in self._attacked_by:
+            attacked = 0
+            for attacks in self.attacks(color).values():
+                attacked |= attacks
+            self._attacked_by[color] = attacked
+        return self._attacked_by[color]
+
+
+def extract_features(board, color, pawn_table=None):
+    """Return all positional features of `color` as a dict of ints."""
+
+    return PositionFeatures(board, color, pawn_table).values()
+
+
+def extract_both_colors(board, features=FEATURES, pawn_table=None):
+    """Return the features of both sides as a dict keyed by color, from one shared analysis."""
+
+    analysis = BoardAnalysis(board)
+    return {color: PositionFeatures(board, color, pawn_table, analysis).values(features) for color in chess.COLORS}
+
+
+def _attackers_mask(board, color, square, occupied):
+    """Pieces of `color` attacking `square` when only `occupied` blocks sliders."""
+
+    queens_and_rooks = board.queens | board.rooks
+    queens_and_bishops = board.queens | board.bishops
+
+    attackers = (
+        (chess.BB_KING_ATTACKS[square] & board.kings)
+        | (chess.BB_KNIGHT_ATTACKS[square] & board.knights)
+        | (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] & queens_and_rooks)
+        | (chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied] & queens_and_rooks)
+        | (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & queens_and_bishops)
+        | (chess.BB_PAWN_ATTACKS[not color][square] & board.pawns)
+    )
+
+    return attackers & board.occupied_co[color]
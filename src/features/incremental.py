@@ -0,0 +1,130 @@
+from collections import namedtuple
+
+import chess
+
+from src.features.extractor import FEATURES, FIANCHETTO_KING, FIANCHETTO_QUEEN, PositionFeatures
+from src.features.registry import resolve
+
+# Features reading the side to move or slider attacks, which almost every move
+# changes.
+ALWAYS_STALE = {
+    "king_mobility",
+    "king_attackers_looking_at_ring_1",
+    "checked",
+    "queens_mobility",
+    "connected_rooks",
+    "connectivity",
+}
+
+PAWN_STRUCTURE = {"passed_pawns", "isolated_pawns", "central_pawns", "blocked_pawns"}
+
+FIANCHETTO_MASKS = {
+    feature: {color: sum(chess.BB_SQUARES[square] for square in squares[color]) for color in chess.COLORS}
+    for feature, squares in (("fianchetto_queen", FIANCHETTO_QUEEN), ("fianchetto_king", FIANCHETTO_KING))
+}
+
+
+class IncrementalFeatures:
+    """Positional features updated from the previous position instead of from scratch.
+
+    Keeps the bitboards and feature values of the last position seen for each
+    color. For a new position only the features whose inputs differ are
+    recomputed: pawn structure when pawns move or are captured, castling rights
+    when they change, open files on pawn or rook changes, and so on. Features
+    built on slider attacks are always recomputed. Positions can come in any
+    order, though consecutive plies share the most.
+    """
+
+    def __init__(self, features=FEATURES, pawn_table=None):
+        self.features = resolve(features)
+        self.pawn_table = pawn_table
+        self._snapshots = {}
+        self._values = {color: {} for color in chess.COLORS}
+
+    def values(self, board, color):
+        """Return the features of `color` on `board` as a dict of ints."""
+
+        snapshot = Snapshot.of(board)
+        previous = self._snapshots.get(color)
+        stale = set(self.features) if previous is None else stale_features(previous, snapshot, color)
+        stale.intersection_update(self.features)
+
+        if stale:
+            position = PositionFeatures(board, color, self.pawn_table)
+            values = self._values[color]
+            for feature in stale:
+                values[feature] = getattr(position, feature)
+        self._snapshots[color] = snapshot
+
+        return {feature: self._values[color][feature] for feature in self.features}
+
+
+def stale_features(before, after, color):
+    """Names of the features of `color` that may differ between two snapshots."""
+
+    if before == after:
+        return set()
+
+    ours_before, ours_after = before.occupied_co[color], after.occupied_co[color]
+    pawns, _, bishops, rooks, _, kings = before.pieces
+    touched = _touched(before, after)
+    stale = set(ALWAYS_STALE)
+
+    if pawns != after.pieces[0] or before.ep != after.ep or touched & after.ep:
+        stale.update(PAWN_STRUCTURE)
+    elif touched & _blocked_pawn_inputs(pawns & ours_after, color):
+        stale.add("blocked_pawns")
+
+    if before.castling != after.castling:
+        stale.add("castling_rights")
+
+    if bishops & ours_before != after.pieces[2] & ours_after:
+        stale.add("bishop_pair")
+
+    for feature, masks in FIANCHETTO_MASKS.items():
+        if touched & masks[color]:
+            stale.add(feature)
+
+    if pawns != after.pieces[0] or rooks & ours_before != after.pieces[3] & ours_after:
+        stale.add("open_files_rooks_count")
+
+    king = after.pieces[5] & ours_after
+    if kings & ours_before != king:
+        stale.update(("king_centrality", "king_defenders_at_ring_1"))
+    elif (ours_before ^ ours_after) & chess.BB_KING_ATTACKS[chess.msb(king)]:
+        stale.add("king_defenders_at_ring_1")
+
+    return stale
+
+
+def _touched(before, after):
+    """Squares whose occupant differs in color or piece type between two snapshots."""
+
+    touched = (before.occupied_co[0] ^ after.occupied_co[0]) | (before.occupied_co[1] ^ after.occupied_co[1])
+    for a, b in zip(before.pieces, after.pieces):
+        touched |= a ^ b
+    return touched
+
+
+def _blocked_pawn_inputs(pawns, color):
+    """Squares whose occupants decide whether `pawns` of `color` are blocked."""
+
+    if color == chess.WHITE:
+        return (pawns << 8 | (pawns & ~chess.BB_FILE_A) << 7 | (pawns & ~chess.BB_FILE_H) << 9) & chess.BB_ALL
+    return pawns >> 8 | (pawns & ~chess.BB_FILE_A) >> 9 | (pawns & ~chess.BB_FILE_H) >> 7
+
+
+class Snapshot(namedtuple("Snapshot", ["pieces", "occupied_co", "castling", "ep", "turn"])):
+    """Bitboards and rights that the features are computed from."""
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, board):
+        return cls(
+            (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings),
+            (board.occupied_co[chess.BLACK], board.occupied_co[chess.WHITE]),
+            board.clean_castling_rights(),
+            chess.BB_SQUARES[board.ep_square] if board.ep_square else 0,
+            board.turn,
+        )
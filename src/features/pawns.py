@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+class PawnHashTable:
+    """Bounded LRU cache of pawn-structure features keyed on the pawn bitboards.
+
+    Pawn structures repeat across many positions of a game and across games,
+    so features computed once for a structure are reused until the entry is
+    evicted. Entries hold the passed, isolated and central pawn counts;
+    `blocked_pawns` also reads the other pieces and the en passant square, so
+    it is not cached. Pass a table to `PositionFeatures` to consult it.
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, our_pawns, their_pawns, color, compute):
+        """Return the pawn features of a structure, calling `compute` to fill the entry on a miss."""
+
+        key = (our_pawns, their_pawns, color)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = self._entries[key] = compute()
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        """Return the hit and miss counts, the hit rate and the number of cached structures."""
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,16 @@
+from src.features.extractor import FEATURES
+
+
+def resolve(features):
+    """Check a list of feature names and return it without duplicates.
+
+    Raises ValueError for names that are not in `FEATURES`.
+    """
+
+    names = []
+    for name in features:
+        if name not in FEATURES:
+            raise ValueError(f"No such feature exists: {name}.")
+        if name not in names:
+            names.append(name)
+    return names
@@ -0,0 +1,163 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+import chess.pgn
+
+# Tag lines, rest-of-line comments and brace comments are matched whole, so an
+# "[Event " inside a comment or a tag value does not count as a game start.
+GAME_START_REGEX = re.compile(rb"^(\[Event )[^\n]*|^\[[^\n]*|;[^\n]*|\{[^}]*\}", re.MULTILINE)
+
+# Sidecar layout: header followed by the offsets as a little-endian array.
+# The header records the size, mtime and hash of the PGN the offsets describe.
+SIDECAR_MAGIC = b"PGNIDX02"
+SIDECAR_HEADER = struct.Struct("<8sQqQ1s16s")
+
+
+class PgnIndex:
+    """Byte offsets of every game in a PGN file for random access by game number.
+
+    The offsets are persisted next to the PGN (`1.pgn.idx`) and reused as long
+    as the file is unchanged. A PGN that has only grown is scanned from the old
+    end onwards, anything else triggers a full rescan.
+    """
+
+    def __init__(self, pgn_path, use_sidecar=True):
+        self.pgn_path = pgn_path
+        self.index_path = f"{pgn_path}.idx"
+
+        if use_sidecar:
+            self.offsets = self._load()
+        else:
+            self.offsets = self._scan()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def game_offset(self, n):
+        """Return the byte offset of the n-th game (counting from 1)."""
+
+        if n < 1 or n > len(self.offsets):
+            raise ValueError("No such game number exists in the PGN file.")
+        return self.offsets[n - 1]
+
+    def read_game(self, n, **kwargs):
+        """Seek to the n-th game and parse only that game."""
+
+        with open(self.pgn_path) as pgn_file:
+            pgn_file.seek(self.game_offset(n))
+            game = chess.pgn.read_game(pgn_file, **kwargs)
+
+        if game is None:
+            raise ValueError("No such game number exists in the PGN file.")
+        return game
+
+    def _load(self):
+        """Return offsets from the sidecar, updating it if the PGN has changed."""
+
+        stat = os.stat(self.pgn_path)
+        sidecar = self._read_sidecar()
+
+        if sidecar is not None:
+            size, mtime_ns, digest, offsets = sidecar
+
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                return offsets
+
+            if size <= stat.st_size and digest == self._digest(size):
+                # Only appended to (or merely touched): scan from the last game
+                # on, as the old end may lie inside one of its comments.
+                offsets.extend(
+                    offset for offset in self._scan(offsets[-1] if offsets else 0) if not offsets or offset > offsets[-1]
+                )
+                self._write_sidecar(stat, offsets)
+                return offsets
+
+        offsets = self._scan()
+        self._write_sidecar(stat, offsets)
+        return offsets
+
+    def _read_sidecar(self):
+        """Read the sidecar file, returning None if it is missing or unreadable."""
+
+        try:
+            with open(self.index_path, "rb") as index_file:
+                data = index_file.read()
+        except OSError:
+            return None
+
+        if len(data) < SIDECAR_HEADER.size:
+            return None
+
+        magic, size, mtime_ns, count, typecode, digest = SIDECAR_HEADER.unpack_from(data)
+        if magic != SIDECAR_MAGIC or typecode not in (b"I", b"Q"):
+            return None
+
+        offsets = array(typecode.decode())
+        body = data[SIDECAR_HEADER.size :]
+        if len(body) != count * offsets.itemsize:
+            return None
+
+        offsets.frombytes(body)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return size, mtime_ns, digest, offsets.tolist()
+
+    def _write_sidecar(self, stat, offsets):
+        """Atomically persist the offsets, silently skipping unwritable locations."""
+
+        typecode = "I" if stat.st_size < 2**32 else "Q"
+        body = array(typecode, offsets)
+        if sys.byteorder == "big":
+            body.byteswap()
+
+        header = SIDECAR_HEADER.pack(
+            SIDECAR_MAGIC,
+            stat.st_size,
+            stat.st_mtime_ns,
+            len(offsets),
+            typecode.encode(),
+            self._digest(stat.st_size),
+        )
+
+        temporary_path = f"{self.index_path}.tmp"
+        try:
+            with open(temporary_path, "wb") as index_file:
+                index_file.write(header)
+                index_file.write(body.tobytes())
+            os.replace(temporary_path, self.index_path)
+        except OSError:
+            pass
+
+    def _digest(self, size):
+        """Hash the first `size` bytes of the PGN."""
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.pgn_path, "rb") as pgn_file:
+            while size > 0:
+                chunk = pgn_file.read(min(size, 1 << 20))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size -= len(chunk)
+        return digest.digest()
+
+    def _scan(self, start=0):
+        """Find the offset of every `[Event` header line outside comments from `start` onwards.
+
+        `start` must not lie inside a comment.
+        """
+
+        with open(self.pgn_path, "rb") as pgn_file:
+            try:
+                data = mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be memory-mapped.
+                return []
+
+            with data:
+                return [match.start() for match in GAME_START_REGEX.finditer(data, start) if match.group(1)]
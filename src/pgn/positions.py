@@ -0,0 +1,13 @@
+def mainline_positions(game):
+    """Return the board before the first mainline move of a game and after every move.
+
+    Works for `chess.pgn.Game` and `MainlineGame`. Boards keep their move stack,
+    so an engine analysing them sees the game history and detects repetitions.
+    """
+
+    board = game.board()
+    positions = [board.copy()]
+    for move in game.mainline_moves():
+        board.push(move)
+        positions.append(board.copy())
+    return positions
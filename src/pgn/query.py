@@ -0,0 +1,181 @@
+import mmap
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+
+from src.pgn.index import PgnIndex
+
+HEADER_LINE_REGEX = re.compile(rb"\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+\"([^\r\n]*)\"\]\s*?\r?\n")
+
+GameRef = namedtuple("GameRef", ["pgn_path", "game_number", "offset", "headers"])
+
+
+class PgnCorpus:
+    """Header-only view of one or more PGN files with indexes for selecting games.
+
+    Only the tag pairs of each game are read, movetext is never parsed. The
+    selected games keep their file and game number, so they can be handed to
+    `ChessGame(ref.pgn_path, game_number=ref.game_number)` which seeks to them
+    through the persisted `PgnIndex`.
+    """
+
+    def __init__(self, pgn_paths):
+        if isinstance(pgn_paths, str):
+            pgn_paths = [pgn_paths]
+
+        self.games = []
+        for pgn_path in pgn_paths:
+            self.games.extend(self._scan_headers(pgn_path))
+
+        self._build_indexes()
+
+    def __len__(self):
+        return len(self.games)
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def select(
+        self,
+        white=None,
+        black=None,
+        player=None,
+        event=None,
+        round=None,
+        eco=None,
+        min_elo=None,
+        max_elo=None,
+        date_from=None,
+        date_to=None,
+    ):
+        """Return the games matching every given criterion, in corpus order.
+
+        Elo bounds apply to both players, games without ratings never match
+        them. Dates compare as PGN date strings, so `date_from="2024.04"` and
+        `date_to="2024.04"` select all of April 2024. Dates with unknown parts
+        ("????.??.??", "2024.??.??") never match a date range.
+        """
+
+        candidates = []
+        for index, value in (
+            (self._by_white, white),
+            (self._by_black, black),
+            (self._by_player, player),
+            (self._by_event, event),
+            (self._by_round, round),
+            (self._by_eco, eco),
+        ):
+            if value is not None:
+                candidates.append(index.get(value, ()))
+
+        if min_elo is not None:
+            keys, ids = self._by_min_elo
+            candidates.append(ids[bisect_left(keys, min_elo) :])
+
+        if max_elo is not None:
+            keys, ids = self._by_max_elo
+            candidates.append(ids[: bisect_right(keys, max_elo)])
+
+        if date_from is not None or date_to is not None:
+            keys, ids = self._by_date
+            start = 0 if date_from is None else bisect_left(keys, date_from)
+            stop = len(keys) if date_to is None else bisect_right(keys, date_to + "\uffff")
+            candidates.append(ids[start:stop])
+
+        if not candidates:
+            return list(self.games)
+
+        candidates.sort(key=len)
+        selected = set(candidates[0])
+        for ids in candidates[1:]:
+            selected.intersection_update(ids)
+            if not selected:
+                break
+
+        return [self.games[i] for i in sorted(selected)]
+
+    def _scan_headers(self, pgn_path):
+        """Read the tag pairs of every game in a PGN file."""
+
+        offsets = PgnIndex(pgn_path).offsets
+        games = []
+
+        with open(pgn_path, "rb") as pgn_file:
+            try:
+                data = mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return games
+
+            with data:
+                for game_number, offset in enumerate(offsets, start=1):
+                    headers = {}
+                    position = offset
+                    while True:
+                        match = HEADER_LINE_REGEX.match(data, position)
+                        if match is None:
+                            break
+                        tag, value = match.groups()
+                        headers[tag.decode()] = value.decode("utf-8", "replace")
+                        position = match.end()
+
+                    games.append(GameRef(pgn_path, game_number, offset, headers))
+
+        return games
+
+    def _build_indexes(self):
+        """Build the secondary indexes over the scanned headers."""
+
+        self._by_white = defaultdict(list)
+        self._by_black = defaultdict(list)
+        self._by_player = defaultdict(list)
+        self._by_event = defaultdict(list)
+        self._by_round = defaultdict(list)
+        self._by_eco = defaultdict(list)
+        min_elos = []
+        max_elos = []
+        dates = []
+
+        for i, game in enumerate(self.games):
+            headers = game.headers
+            white = headers.get("White")
+            black = headers.get("Black")
+
+            self._by_white[white].append(i)
+            self._by_black[black].append(i)
+            self._by_player[white].append(i)
+            if black != white:
+                self._by_player[black].append(i)
+            self._by_event[headers.get("Event")].append(i)
+            self._by_round[headers.get("Round")].append(i)
+            self._by_eco[headers.get("ECO")].append(i)
+
+            white_elo = _parse_elo(headers.get("WhiteElo"))
+            black_elo = _parse_elo(headers.get("BlackElo"))
+            if white_elo is not None and black_elo is not None:
+                min_elos.append((min(white_elo, black_elo), i))
+                max_elos.append((max(white_elo, black_elo), i))
+
+            # "?" sorts after the digits, so unknown dates would match any open-ended range.
+            date = headers.get("Date")
+            if date is not None and "?" not in date:
+                dates.append((date, i))
+
+        self._by_min_elo = _sorted_index(min_elos)
+        self._by_max_elo = _sorted_index(max_elos)
+        self._by_date = _sorted_index(dates)
+
+
+def _parse_elo(value):
+    """Return a rating as an int, or None for missing and unknown ratings."""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sorted_index(pairs):
+    """Split (key, id) pairs into sorted parallel key and id lists for bisection."""
+
+    pairs.sort()
+    return [key for key, _ in pairs], [i for _, i in pairs]
@@ -0,0 +1,67 @@
+import logging
+
+import chess.pgn
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MainlineGame:
+    """Headers and mainline moves of a game, without the GameNode tree.
+
+    Exposes the parts of `chess.pgn.Game` that `ChessGame` relies on, so the
+    two can be used interchangeably.
+    """
+
+    def __init__(self, headers, moves, errors=None):
+        self.headers = headers
+        self.moves = moves
+        self.errors = errors or []
+
+    def board(self):
+        """Return the starting position of the game."""
+
+        return self.headers.board()
+
+    def mainline_moves(self):
+        """Return the mainline moves as a flat list."""
+
+        return self.moves
+
+    def __repr__(self):
+        return f"<MainlineGame {self.headers.get('White', '?')!r} vs. {self.headers.get('Black', '?')!r}, {len(self.moves)} plies>"
+
+
+class MainlineVisitor(chess.pgn.BaseVisitor):
+    """Visitor for `chess.pgn.read_game` that keeps only headers and mainline moves.
+
+    Variations are skipped wholesale and comments and NAGs are dropped, so no
+    GameNode objects are created at all.
+    """
+
+    def begin_game(self):
+        self.headers = chess.pgn.Headers()
+        self.moves = []
+        self.errors = []
+
+    def begin_headers(self):
+        return self.headers
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        self.moves.append(move)
+
+    def visit_result(self, result):
+        if self.headers.get("Result", "*") == "*":
+            self.headers["Result"] = result
+
+    def handle_error(self, error):
+        LOGGER.error("%s while parsing %r", error, self.headers)
+        self.errors.append(error)
+
+    def result(self):
+        return MainlineGame(self.headers, self.moves, self.errors)
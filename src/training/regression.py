@@ -0,0 +1,141 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.dataset.store import FeatureStore
+
+WEIGHTS_PATH = "data/feature_weights.json"
+
+
+class NormalEquations:
+    """Sufficient statistics of a least-squares fit of evaluations on features.
+
+    Holds XᵀX, Xᵀy and yᵀy over the rows seen so far, with a leading column of
+    ones in X for the intercept. They are (features + 1)² numbers however many
+    rows went in, and statistics of disjoint row sets add up to those of their
+    union, so shards can be accumulated separately and merged with `+`.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        size = len(self.features) + 1
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.count = 0
+
+    def update(self, X, y):
+        """Add rows of a (rows, features) matrix and their evaluations."""
+
+        X = np.column_stack([np.ones(len(X)), np.asarray(X, dtype=np.float64)])
+        y = np.asarray(y, dtype=np.float64)
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += y @ y
+        self.count += len(y)
+
+    def __add__(self, other):
+        if self.features != other.features:
+            raise ValueError("Cannot merge statistics of different features.")
+
+        merged = NormalEquations(self.features)
+        merged.xtx = self.xtx + other.xtx
+        merged.xty = self.xty + other.xty
+        merged.yty = self.yty + other.yty
+        merged.count = self.count + other.count
+        return merged
+
+    def solve(self, ridge=0.0):
+        """Return the intercept and a dict of feature weights minimising the squared error.
+
+        `ridge` adds an L2 penalty on the weights (not the intercept). Features
+        that are zero in every row get a weight of zero.
+        """
+
+        if not self.count:
+            raise ValueError("No rows to fit.")
+
+        penalty = np.eye(len(self.xty)) * ridge
+        penalty[0, 0] = 0.0
+        coefficients = np.linalg.lstsq(self.xtx + penalty, self.xty, rcond=None)[0]
+        return coefficients[0], dict(zip(self.features, coefficients[1:]))
+
+    def mean_squared_error(self, intercept, weights):
+        """Mean squared error of a fit over the accumulated rows, computed from the statistics alone."""
+
+        if not self.count:
+            raise ValueError("No rows to evaluate.")
+
+        coefficients = np.array([intercept] + [weights[feature] for feature in self.features])
+        residual = self.yty - 2 * coefficients @ self.xty + coefficients @ self.xtx @ coefficients
+        return residual / self.count
+
+
+def accumulate(store_path, start, stop, features=None, chunk_size=1000000, test_every=5):
+    """Accumulate the rows `start` to `stop` of a feature store into train and test statistics.
+
+    Every `test_every`-th game goes to the test statistics so that positions of
+    one game never end up on both sides; pass None to use every row for training.
+    Rows are read `chunk_size` at a time.
+    """
+
+    store = FeatureStore(store_path)
+    features = store.features if features is None else list(features)
+    train, test = NormalEquations(features), NormalEquations(features)
+
+    for chunk_start in range(start, stop, chunk_size):
+        rows = slice(chunk_start, min(chunk_start + chunk_size, stop))
+        X = store.matrix(features, rows)
+        y = store["evaluation_score"][rows]
+
+        if test_every is None:
+            train.update(X, y)
+            continue
+
+        held_out = store["game"][rows] % test_every == 0
+        train.update(X[~held_out], y[~held_out])
+        test.update(X[held_out], y[held_out])
+
+    return train, test
+
+
+def fit(store_path, features=None, shards=1, chunk_size=1000000, test_every=5):
+    """Accumulate a whole feature store, in `shards` parallel processes when more than one.
+
+    Returns the merged train and test `NormalEquations`.
+    """
+
+    rows = len(FeatureStore(store_path))
+    bounds = np.linspace(0, rows, shards + 1).astype(int)
+    ranges = [(store_path, start, stop, features, chunk_size, test_every) for start, stop in zip(bounds, bounds[1:])]
+
+    if shards == 1:
+        results = [accumulate(*arguments) for arguments in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=shards) as executor:
+            results = list(executor.map(accumulate, *zip(*ranges)))
+
+    train, test = results[0]
+    for shard_train, shard_test in results[1:]:
+        train, test = train + shard_train, test + shard_test
+    return train, test
+
+
+def save_weights(intercept, weights, path=WEIGHTS_PATH):
+    """Atomically write fitted weights to a JSON file."""
+
+    data = {"intercept": float(intercept), "weights": {feature: float(w) for feature, w in weights.items()}}
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as weights_file:
+        json.dump(data, weights_file, indent=1)
+    os.replace(temporary_path, path)
+
+
+def load_weights(path=WEIGHTS_PATH):
+    """Read the intercept and feature weights written by `save_weights`."""
+
+    with open(path) as weights_file:
+        data = json.load(weights_file)
+    return data["intercept"], data["weights"]